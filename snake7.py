@@ -8,29 +8,75 @@ Date first created: 2 May 2020
 
 """
 import random
-import tkinter as tk
+try:
+    import tkinter as tk
+except ImportError:     # Headless machines can still run SnakeModel and run_headless
+    tk = None
 #from tkinter.font import Font
 import time
 from enum import IntEnum
 import unittest
 #from pprint import pprint
-import copy
+import argparse
+import contextlib
+import csv
+import io
+import json
+from collections import deque
+from array import array
 
 class Snake:
     """ This is the controller class. It connects the view class to the model class and allows a user to play the game with the
     keys on their keyboard. """
-    def __init__(self):
-        """ Initializes the snake game """
+    def __init__(self, num_rows = 30, num_cols = 30, view_class = None, run = True, instrument = False,
+                 timings_path = None, turn_steps = False, max_catch_up = 5):
+        """ 
+        Initializes the snake game 
+        view_class picks the renderer, SnakeView, SnakeCanvasView or SnakeViewportView. By default big boards use
+        the canvas, and boards too big to show whole at one pixel per cell a viewport that follows the head.
+        With run False the window is built but mainloop is not entered, for tests and benchmarks.
+        instrument records the time of every step in a StepTimings and shows percentiles in the score frame,
+        timings_path is a .csv or .json file they are saved to on quit.
+        With turn_steps a turn moves the snake at once instead of waiting for the next tick.
+        max_catch_up is the most steps run in one tick when the game falls behind its deadlines.
+        """
         # Define parameters
         self.times_clicked = 0
-        self.NUM_ROWS = 30
-        self.NUM_COLS = 30
+        self.NUM_ROWS = num_rows
+        self.NUM_COLS = num_cols
         self.DEFAULT_STEP_TIME_MILLIS = 1000
         self.STEPTIME_MILLIS = self.DEFAULT_STEP_TIME_MILLIS
         self.is_running = False
         self.currentPoints = 0
+        self.autopilot = None   # Called with the model before each step to steer, when the autopilot is on
+        self.timings = StepTimings() if instrument else None
+        self.latencies = InputLatencies() if instrument else None
+        self.timings_path = timings_path
+        self.TIMINGS_REFRESH_STEPS = 10     # Steps between updates of the timings label
+        self.model_time = self.render_time = 0.0   # Seconds taken by the model and the repaint in the last step
+        self.last_tick = 0.0
+        self.scheduled_millis = 0
+        # Fixed timestep loop: tick n is due at tick_base + n * STEPTIME_MILLIS on the monotonic clock, 
+        # so late ticks do not push the later ones back
+        self.MAX_CATCH_UP_STEPS = max_catch_up     # Most model steps run in one tick when the game falls behind
+        self.tick_base = 0.0
+        self.ticks_done = 0
+        self.play_time = 0.0    # Seconds played before the last pause
+        self.resume_time = 0.0
+        # Arrow keys are queued and used one per step, so quick turns within a tick are not lost
+        self.turns = TurnQueue()
+        self.turn_steps = turn_steps
         # Create view
-        self.view = SnakeView(self.NUM_ROWS, self.NUM_COLS)
+        if view_class is None:
+            if max(self.NUM_ROWS, self.NUM_COLS) > SnakeCanvasView.MAX_BOARD_PIXELS:
+                view_class = SnakeViewportView
+            elif self.NUM_ROWS * self.NUM_COLS > SnakeCanvasView.MIN_CANVAS_CELLS:
+                view_class = SnakeCanvasView
+            else:
+                view_class = SnakeView
+        self.view = view_class(self.NUM_ROWS, self.NUM_COLS)
+        if self.timings is not None:
+            self.view.add_timings_label()
         self.Model = SnakeModel(self.NUM_COLS,self.NUM_ROWS)
         
         # Set up the control
@@ -44,6 +90,12 @@ class Snake:
         # Wraparound
         self.view.set_wraparound_handler(self.wraparound_handler)
 
+        # Autopilot
+        self.view.set_autopilot_handler(self.autopilot_handler)
+
+        # Turn steps
+        self.view.set_turn_steps_handler(self.turn_steps_handler, turn_steps)
+
         # Reset 
         self.view.set_reset_handler(self.reset_handler)
 
@@ -58,13 +110,21 @@ class Snake:
         self.view.set_down_handler(self.down_handler)
         self.view.set_up_handler(self.up_handler)
 
+        # Draw the starting board once, after that only changed cells are repainted
+        self.repaint_board()
+
         # Start the simulation
-        self.view.window.mainloop()
+        if run:
+            self.view.window.mainloop()
     
     def start_handler(self):
         """ Start simulation  """
         if not self.is_running:
             self.is_running = True
+            now = time.perf_counter()
+            self.resume_time = self.tick_base = self.last_tick = now
+            self.ticks_done = 0
+            self.scheduled_millis = self.STEPTIME_MILLIS
             self.view.schedule_next_step(self.STEPTIME_MILLIS, 
                                        self.continue_simulation)
             self.view.start_time = time.time()
@@ -74,19 +134,45 @@ class Snake:
         if self.is_running:
             self.view.cancel_next_step()
             self.is_running = False
-            self.view.view_pause_time = float(self.view.str_var.get()[5:])
+            self.play_time += time.perf_counter() - self.resume_time
+
+    def elapsed_time(self):
+        """ Seconds the game has been running, pauses left out, measured on the monotonic clock """
+        if self.is_running:
+            return self.play_time + time.perf_counter() - self.resume_time
+        return self.play_time
         
     def reset_handler(self):
-        """ Reset simulation """
-        self.quit_handler()
-        snake_game = Snake()
+        """ Reset simulation in place: new game on the same model and window, only the cells that change repainted """
+        self.pause_handler()
+        model = self.Model
+        old_cells = list(model.snake_body)
+        if model.food >= 0:
+            old_cells.append(model.food)
+        model.reset()
+        self.currentPoints = 0
+        self.play_time = 0.0
+        self.turns.clear()
+        if self.autopilot is not None:
+            self.autopilot = type(self.autopilot)()
+        self.view.reset_labels()
+        new_cells = list(model.snake_body)
+        if model.food >= 0:
+            new_cells.append(model.food)
+        exposed = self.view.follow(*divmod(model.snake_body[0], self.NUM_COLS))
+        self.paint_cells(old_cells + new_cells + exposed)
 
     def quit_handler(self):
         """ Quit snake program """
+        if self.timings is not None and self.timings_path:
+            self.timings.export(self.timings_path)
         self.view.window.destroy()
 
     def step_speed_handler(self, value):
         """ Adjust snake speed"""
+        # Deadlines from now on count from the last tick's deadline at the new speed
+        self.tick_base += self.ticks_done * self.STEPTIME_MILLIS / 1000
+        self.ticks_done = 0
         self.STEPTIME_MILLIS = self.DEFAULT_STEP_TIME_MILLIS // int(value)                
   
     def wraparound_handler(self):
@@ -97,30 +183,72 @@ class Snake:
         else:
             self.Model.WRAP_MODE = False
             self.times_clicked += 1
-        
+
+    def autopilot_handler(self):
+        """ Autopilot checkbox, lets snake_autopilot steer instead of the arrow keys """
+        if self.autopilot is None:
+            from snake_autopilot import Autopilot  # Imported here, snake_autopilot imports this module
+            self.autopilot = Autopilot()
+        else:
+            self.autopilot = None
+
+    def turn_steps_handler(self):
+        """ Turn steps checkbox, makes every accepted turn step the snake right away """
+        self.turn_steps = not self.turn_steps
     
     def left_handler(self, event):
         """ What to do when users presses left"""
-        self.Model.change_direction("W")
+        self.turn("W")
         
     def right_handler(self,event):
         """What to do when users presses right """
-        self.Model.change_direction("E")
+        self.turn("E")
         
     def up_handler(self,event):
         """ What to do when users presses up"""
-        self.Model.change_direction("N")
+        self.turn("N")
 
     def down_handler(self,event):
         """ What to do when users presses down """
-        self.Model.change_direction("S")
+        self.turn("S")
 
-    def continue_simulation(self):
-        """ Perform another step of the simulation, and schedule
-            the next step.
-        """
+    def turn(self, direction):
+        """ Queue a turn for the coming steps. In turn steps mode an accepted turn is stepped at once """
+        if self.turns.push(direction, self.Model.next_direction, time.perf_counter()):
+            if self.turn_steps and self.is_running:
+                self.step_now()
+
+    def step_now(self):
+        """ Step right away and start counting the tick deadlines again from now """
+        self.view.cancel_next_step()
+        self.tick_base = self.last_tick = time.perf_counter()
+        self.ticks_done = 0
+        self.scheduled_millis = self.STEPTIME_MILLIS
+        self.view.show_time(self.elapsed_time())
         self.one_step()
         self.view.schedule_next_step(self.STEPTIME_MILLIS, self.continue_simulation)
+
+    def continue_simulation(self):
+        """ Perform the steps of the simulation that are due, render once, and schedule
+            the next step for its deadline.
+        """
+        tick = time.perf_counter()
+        step_time = self.STEPTIME_MILLIS / 1000
+        # Every deadline that passed since the last tick is a step to catch up on, up to MAX_CATCH_UP_STEPS
+        due = max(1, int((tick - self.tick_base) / step_time) - self.ticks_done)
+        self.ticks_done += due
+        self.view.show_time(self.elapsed_time())
+        self.one_step(min(due, self.MAX_CATCH_UP_STEPS))
+        deadline = self.tick_base + (self.ticks_done + 1) * step_time
+        delay_millis = max(0, int(round((deadline - time.perf_counter()) * 1000)))
+        if self.timings is not None:
+            self.timings.record(self.model_time, self.render_time, self.scheduled_millis / 1000, 
+                                tick - self.last_tick)
+            self.last_tick = tick
+            self.scheduled_millis = (deadline - tick) * 1000
+            if self.timings.count % self.TIMINGS_REFRESH_STEPS == 0:
+                self.view.show_timings(self.timings, self.latencies)
+        self.view.schedule_next_step(delay_millis, self.continue_simulation)
     
     def death(self):
         """ Ends snake game when snake goes out of bounds or runs into itself"""
@@ -129,26 +257,66 @@ class Snake:
         self.pause_handler()
         self.view.view_game_over.set("GAME OVER")
         
-    def one_step(self):
-        """ Simulate one step of the snake game """
+    def one_step(self, steps = 1):
+        """ Simulate steps steps of the snake game, then repaint the cells they changed once """
         if self.is_running:
-            try:
-                cell_list, self.currentPoints = self.Model.next_step()
-                self.view.viewPoints.set("Points: " + str(self.currentPoints))
-                self.view.view_points_per_sec.set("Points per sec: " + str(round(self.currentPoints/(self.view.newtime + .0000001),2)))
-            except Exception:
-                self.death()
+            if self.timings is not None:
+                start = time.perf_counter()
+            changed_cells = []
+            pressed = []
+            for step in range(steps):
+                if self.turns:
+                    direction, pressed_at = self.turns.pop()
+                    self.Model.change_direction(direction)
+                    pressed.append(pressed_at)
+                if self.autopilot is not None:
+                    direction = self.autopilot(self.Model)
+                    if direction is not None:
+                        self.Model.change_direction(direction)
+                outcome = self.Model.next_step()
+                changed_cells += self.Model.changed_cells
+                if outcome >= StepOutcome.DIED_WALL:
+                    self.death()
+                    break
+            self.currentPoints = self.Model.current_points
+            # A viewport scrolls with the head and hands back the cells that came into view
+            changed_cells += self.view.follow(*divmod(self.Model.snake_body[0], self.NUM_COLS))
+            self.view.viewPoints.set("Points: " + str(self.currentPoints))
+            self.view.view_points_per_sec.set("Points per sec: " + str(round(self.currentPoints/(self.view.newtime + .0000001),2)))
+            if self.timings is None:
+                self.paint_cells(changed_cells)
             else:
-                for row in range(self.NUM_ROWS):
-                    for col in range(self.NUM_COLS):
-                        if cell_list[row][col].cell_state == CellState.SNAKE:
-                            self.view.make_snake(row, col)
-                        elif cell_list[row][col].cell_state == CellState.SNAKE_HEAD:
-                            self.view.make_head(row, col)
-                        elif cell_list[row][col].cell_state == CellState.FOOD:
-                            self.view.make_food(row, col)
-                        else:
-                            self.view.make_empty(row, col)
+                stepped = time.perf_counter()
+                self.paint_cells(changed_cells)
+                painted = time.perf_counter()
+                self.model_time = stepped - start
+                self.render_time = painted - stepped
+                for pressed_at in pressed:
+                    self.latencies.record(painted - pressed_at)
+
+    def paint_cells(self, cell_ids):
+        """ Repaint only the given cells (ids y * NUM_COLS + x) of the board to match their current state """
+        board = self.Model.board
+        for cell_id in cell_ids:
+            row, col = divmod(cell_id, self.NUM_COLS)
+            if board[cell_id] == CellState.SNAKE:
+                self.view.make_snake(row, col)
+            elif board[cell_id] == CellState.SNAKE_HEAD:
+                self.view.make_head(row, col)
+            elif board[cell_id] == CellState.FOOD:
+                self.view.make_food(row, col)
+            else:
+                self.view.make_empty(row, col)
+
+    def repaint_board(self):
+        """ Full resync: clear the board, then repaint the snake and the food, the only cells that are not empty """
+        model = self.Model
+        self.view.reset()
+        self.view.follow(*divmod(model.snake_body[0], self.NUM_COLS))
+        cell_ids = list(model.snake_body)
+        if model.food >= 0:
+            cell_ids.append(model.food)
+        self.paint_cells(cell_ids)
     
 class SnakeView:
     """ This class controls the view of the board the snake is played on, which is divided into three sections:
@@ -157,15 +325,13 @@ class SnakeView:
     def __init__(self, num_rows, num_cols):
         """ Initialize view of the game """
         # Constants
-        self.time_take_2 = 0
         self.death = False
-        self.CELL_SIZE = 20 #Size in pixels
+        self.CELL_SIZE = self.cell_size(num_rows, num_cols) #Size in pixels
         self.CONTROL_FRAME_HEIGHT = 100
         self.SCORE_FRAME_WIDTH = 200
         # Size of grid
         self.num_rows = num_rows
         self.num_cols = num_cols
-        self.view_pause_time = 0
         self.start_time = time.time()
         self.newtime = 0
         # Create window
@@ -192,7 +358,8 @@ class SnakeView:
         self.control_frame.grid(row = 2, column = 1, columnspan = 2) # use grid layout manager
         (self.start_button, self.pause_button, 
                  self.wraparound_button, self.step_speed_slider, 
-                 self.reset_button, self.quit_button) = self.add_control()
+                 self.reset_button, self.quit_button, self.autopilot_button,
+                 self.turn_steps_button) = self.add_control()
         
         # Create frame for scoring panel
         self.score_frame = tk.Frame(self.window, width = self.SCORE_FRAME_WIDTH, 
@@ -206,6 +373,10 @@ class SnakeView:
         self.game_over = tk.Label(self.score_frame, textvariable = self.view_game_over)
         self.game_over.grid(row = 100, column = 1)
     
+    def cell_size(self, num_rows, num_cols):
+        """ Size of one cell in pixels """
+        return 20
+
     def reset_time(self):
         """ Stores the time at the start of the game"""
         self.start_time = time.time()
@@ -241,20 +412,37 @@ class SnakeView:
         checkValue.set(False)
         wraparound_button = tk.Checkbutton(self.control_frame, text="Wraparound", var = checkValue)
         wraparound_button.grid(row=1, column=7,padx = 40, pady = self.CONTROL_FRAME_HEIGHT/2)
+        autopilotValue = tk.BooleanVar()
+        autopilotValue.set(False)
+        autopilot_button = tk.Checkbutton(self.control_frame, text="Autopilot", var = autopilotValue)
+        autopilot_button.grid(row=1, column=8,padx = 40, pady = self.CONTROL_FRAME_HEIGHT/2)
+        self.turn_steps_value = tk.BooleanVar()
+        self.turn_steps_value.set(False)
+        turn_steps_button = tk.Checkbutton(self.control_frame, text="Turn steps", var = self.turn_steps_value)
+        turn_steps_button.grid(row=1, column=9,padx = 40, pady = self.CONTROL_FRAME_HEIGHT/2)
 
         # Vertically center the controls in the control frame
         self.control_frame.grid_rowconfigure(1, weight = 1) 
 
         # Horizontally center the controls in the control frame
         self.control_frame.grid_columnconfigure(0, weight = 1) 
-        self.control_frame.grid_columnconfigure(7, weight = 1)
+        self.control_frame.grid_columnconfigure(9, weight = 1)
         return (start_button, pause_button, wraparound_button, step_speed_slider, 
-                reset_button, quit_button)
+                reset_button, quit_button, autopilot_button, turn_steps_button)
     
     def set_wraparound_handler(self,handler):
         """ Set handler for clicking on wraparound checkbox to the function handler """
         self.wraparound_button.configure(command = handler)
 
+    def set_autopilot_handler(self,handler):
+        """ Set handler for clicking on autopilot checkbox to the function handler """
+        self.autopilot_button.configure(command = handler)
+
+    def set_turn_steps_handler(self, handler, checked = False):
+        """ Set handler for clicking on the turn steps checkbox to the function handler """
+        self.turn_steps_value.set(checked)
+        self.turn_steps_button.configure(command = handler)
+
     def set_start_handler(self, handler):
         """ Set handler for clicking on start button to the function handler """
         self.start_button.configure(command = handler)
@@ -272,8 +460,9 @@ class SnakeView:
         self.reset_button.configure(command = handler)
 
     def set_quit_handler(self, handler):
-        """ Set handler for clicking on quit button to the function handler """
+        """ Set handler for clicking on quit button, and for closing the window from its title bar, to the function handler """
         self.quit_button.configure(command = handler)
+        self.window.protocol("WM_DELETE_WINDOW", handler)
 
     def set_step_speed_handler(self, handler):
         """ Set handler for dragging the step speed slider to the function handler """
@@ -309,14 +498,36 @@ class SnakeView:
         points_per_sec_label = tk.Label(self.score_frame, textvariable = self.view_points_per_sec,borderwidth = 1, relief = "solid")
         points_per_sec_label.grid(row=4, column=1, pady = 10)                                                    
         return (score_label, points_label, time_label, points_per_sec_label)
+
+    def add_timings_label(self):
+        """ Add the frame timing panel below the points per second label """
+        self.view_timings = tk.StringVar()
+        self.view_timings.set("Step p50/p95/p99")
+        self.timings_label = tk.Label(self.score_frame, textvariable = self.view_timings, justify = tk.LEFT,
+                                      borderwidth = 1, relief = "solid")
+        self.timings_label.grid(row=5, column=1, pady = 10)
+
+    def show_timings(self, timings, latencies = None):
+        """ 
+        Show the p50/p95/p99 of the model time, render time and tick jitter of a StepTimings, in ms, 
+        and the key to repaint latency of an InputLatencies when given
+        """
+        lines = ["p50/p95/p99 ms"]
+        for name, title in (("model", "Model"), ("render", "Render"), ("jitter", "Jitter")):
+            lines.append(title + ": " + "/".join("%.1f" % (value * 1000) for value in timings.percentiles(name)))
+        if latencies is not None:
+            lines.append("Input: " + "/".join("%.1f" % (value * 1000) for value in latencies.percentiles("latency")))
+        self.view_timings.set("\n".join(lines))
     
     def schedule_next_step(self, step_time_millis, step_handler):
         """ Schedules next step of the simulation """
         if not self.death:
-            self.time_take_2 += step_time_millis / 1000
-            self.newtime = self.time_take_2
             self.start_timer_object = self.window.after(step_time_millis, step_handler)
-            self.str_var.set("Time: " + str(round(self.newtime,2)))
+
+    def show_time(self, seconds):
+        """ Show the measured playing time, the points per second are computed from it too """
+        self.newtime = seconds
+        self.str_var.set("Time: " + str(round(self.newtime,2)))
 
     def make_food(self, row, column):
         """ Make cells with the state FOOD red """
@@ -332,96 +543,597 @@ class SnakeView:
         """ Make cells with the state SNAKE blue """
         self.cells[row][column]['bg'] = 'Blue'
 
+    def follow(self, row, column):
+        """ Keep the cell (row, column), the head, in view. The whole board is always shown, so nothing to do """
+        return []
+
+    def reset_labels(self):
+        """ Score frame back to how a new game starts """
+        self.death = False
+        self.newtime = 0
+        self.start_time = time.time()
+        self.str_var.set("Time: 0")
+        self.view_game_over.set("      ")
+        self.viewPoints.set("Points: 0")
+        self.view_points_per_sec.set("Points per second: 0")
+
     def reset(self):
         """ Reset entire snake game board, all cells empty """
         for r in range(self.num_rows):
             for c in range(self.num_cols):
-                self.cells[r][c]
+                self.make_empty(r, c)
                 
     def cancel_next_step(self):
         """ Cancel the scheduled next step of simulation """
         self.window.after_cancel(self.start_timer_object)
 
+class SnakeCanvasView(SnakeView):
+    """ 
+    View that draws the board into a single image on a tk.Canvas instead of one tk.Frame per cell.
+    Startup and memory no longer grow with one widget per cell, so boards of 500x500 and more stay usable.
+    Same make_* and set_*_handler interface as SnakeView.
+    """
+    MIN_CANVAS_CELLS = 2500     # Snake uses this view by default for boards with more cells than this
+    MAX_BOARD_PIXELS = 800      # Cells shrink so the board fits in this many pixels
+    BORDER_COLOR = 'Black'
+
+    def cell_size(self, num_rows, num_cols):
+        """ Shrink the cells on big boards so the whole board fits on the screen """
+        return max(1, min(20, self.MAX_BOARD_PIXELS // max(num_rows, num_cols)))
+
+    def image_size(self):
+        """ Rows and columns of cells in the board image """
+        return self.num_rows, self.num_cols
+
+    def add_cells(self):
+        """ Create the canvas and the board image in the grid frame """
+        # Cells are drawn inside a one pixel border when they are big enough to have one
+        self.inset = 1 if self.CELL_SIZE >= 4 else 0
+        rows, cols = self.image_size()
+        width = cols * self.CELL_SIZE + self.inset
+        height = rows * self.CELL_SIZE + self.inset
+        self.canvas = tk.Canvas(self.grid_frame, width = width, height = height, 
+                                highlightthickness = 0, borderwidth = 0)
+        self.canvas.grid(row = 0, column = 0)
+        self.board_image = tk.PhotoImage(width = width, height = height)
+        self.canvas.create_image(0, 0, image = self.board_image, anchor = tk.NW)
+        self.reset()
+        return None
+
+    def fill_cell(self, row, column, color):
+        """ Fill the inside of one cell of the board image with color """
+        x0 = column * self.CELL_SIZE + self.inset
+        y0 = row * self.CELL_SIZE + self.inset
+        self.board_image.put(color, to = (x0, y0, x0 + self.CELL_SIZE - self.inset, 
+                                          y0 + self.CELL_SIZE - self.inset))
+
+    def make_food(self, row, column):
+        """ Make cells with the state FOOD red """
+        self.fill_cell(row, column, 'Red')
+
+    def make_head(self, row, column):
+        """ Make cell with the state SNAKE_HEAD black """
+        self.fill_cell(row, column, 'Black')
+
+    def make_empty(self, row, column):
+        """ Make cells with the state EMPTY white """
+        self.fill_cell(row, column, 'White')
+
+    def make_snake(self, row, column):
+        """ Make cells with the state SNAKE blue """
+        self.fill_cell(row, column, 'Blue')
+
+    def reset(self):
+        """ Reset entire snake game board, all cells empty. Draws whole rows and columns, not cells """
+        rows, cols = self.image_size()
+        width = cols * self.CELL_SIZE + self.inset
+        height = rows * self.CELL_SIZE + self.inset
+        self.board_image.put('White', to = (0, 0, width, height))
+        if self.inset:
+            for r in range(rows + 1):
+                y = r * self.CELL_SIZE
+                self.board_image.put(self.BORDER_COLOR, to = (0, y, width, y + 1))
+            for c in range(cols + 1):
+                x = c * self.CELL_SIZE
+                self.board_image.put(self.BORDER_COLOR, to = (x, 0, x + 1, height))
+
+class SnakeViewportView(SnakeCanvasView):
+    """
+    View for boards bigger than the screen: shows a window of VIEW_CELLS x VIEW_CELLS cells that follows the
+    head, and a minimap of the whole board. Rendering costs depend on the window, not on the board.
+    The board image is a ring: board cell (row, column) is drawn at (row % view_rows, column % view_cols), and 
+    the canvas shows the image four times side by side, shifted so the window starts at its top left corner. 
+    Scrolling moves those four canvas items and only the rows and columns that came into view are drawn.
+    Cells outside the window are not drawn, the minimap keeps a count of snake and food cells per block of it.
+    """
+    VIEW_CELLS = 60         # Rows and columns of cells in the window
+    VIEW_CELL_SIZE = 12
+    MINIMAP_PIXELS = 160    # The minimap is at most this many pixels across, one pixel per block of cells
+
+    def __init__(self, num_rows, num_cols):
+        """ Initialize view of the game, with the window at the top left of the board """
+        self.view_rows = min(num_rows, self.VIEW_CELLS)
+        self.view_cols = min(num_cols, self.VIEW_CELLS)
+        self.top = self.left = 0    # Board row and column at the top left of the window
+        self.occupied = {}          # Cell id: state of every cell drawn as not empty, for the minimap counts
+        self.snake_blocks = {}      # Minimap block: number of snake cells in it
+        self.food_blocks = {}
+        self.block_colors = {}      # Minimap block: color of its pixel, when not white
+        super().__init__(num_rows, num_cols)
+        self.add_minimap()
+
+    def cell_size(self, num_rows, num_cols):
+        """ Cells keep one size, only the window is shown """
+        return self.VIEW_CELL_SIZE
+
+    def image_size(self):
+        """ The board image only holds the window """
+        return self.view_rows, self.view_cols
+
+    def add_cells(self):
+        """ Create the canvas with the ring image of the window shown four times """
+        super().add_cells()
+        self.canvas.delete("all")
+        self.tiles = [self.canvas.create_image(0, 0, image = self.board_image, anchor = tk.NW) for tile in range(4)]
+        self.place_tiles()
+        return None
+
+    def add_minimap(self):
+        """ Create the minimap below the score labels, with a rectangle showing where the window is """
+        self.block_rows = -(-self.num_rows // min(self.num_rows, self.MINIMAP_PIXELS))
+        self.block_cols = -(-self.num_cols // min(self.num_cols, self.MINIMAP_PIXELS))
+        self.minimap_rows = -(-self.num_rows // self.block_rows)
+        self.minimap_cols = -(-self.num_cols // self.block_cols)
+        self.minimap = tk.Canvas(self.score_frame, width = self.minimap_cols, height = self.minimap_rows,
+                                 highlightthickness = 1, highlightbackground = self.BORDER_COLOR, borderwidth = 0)
+        self.minimap.grid(row = 6, column = 1, pady = 10)
+        self.minimap_image = tk.PhotoImage(width = self.minimap_cols, height = self.minimap_rows)
+        self.minimap_image.put('White', to = (0, 0, self.minimap_cols, self.minimap_rows))
+        self.minimap.create_image(0, 0, image = self.minimap_image, anchor = tk.NW)
+        self.minimap_window = self.minimap.create_rectangle(0, 0, 0, 0, outline = 'Black')
+        self.place_tiles()
+
+    def place_tiles(self):
+        """ Shift the four copies of the ring image, and the minimap rectangle, to the current window """
+        width = self.view_cols * self.CELL_SIZE
+        height = self.view_rows * self.CELL_SIZE
+        x = -(self.left % self.view_cols) * self.CELL_SIZE
+        y = -(self.top % self.view_rows) * self.CELL_SIZE
+        for index, tile in enumerate(self.tiles):
+            self.canvas.coords(tile, x + width * (index % 2), y + height * (index // 2))
+        if hasattr(self, "minimap_window"):
+            self.minimap.coords(self.minimap_window, self.left // self.block_cols, self.top // self.block_rows,
+                                (self.left + self.view_cols) // self.block_cols, 
+                                (self.top + self.view_rows) // self.block_rows)
+
+    def scroll(self, start, position, size, total):
+        """ Start of a window of size cells along a side of total cells that keeps position a quarter away from its ends """
+        margin = size // 4
+        if position < start + margin:
+            start = position - margin
+        elif position >= start + size - margin:
+            start = position - size + margin + 1
+        return max(0, min(start, total - size))
+
+    def follow(self, row, column):
+        """ Scroll the window to keep the cell (row, column) in view, returns the ids of the cells that came into view """
+        top = self.scroll(self.top, row, self.view_rows, self.num_rows)
+        left = self.scroll(self.left, column, self.view_cols, self.num_cols)
+        if top == self.top and left == self.left:
+            return []
+        old_top, old_left = self.top, self.left
+        self.top, self.left = top, left
+        self.place_tiles()
+        rows = range(top, top + self.view_rows)
+        cols = range(left, left + self.view_cols)
+        kept_rows = [r for r in rows if old_top <= r < old_top + self.view_rows]
+        new_cols = [c for c in cols if not old_left <= c < old_left + self.view_cols]
+        exposed = []
+        for r in rows:
+            if not old_top <= r < old_top + self.view_rows:
+                exposed.extend(r * self.num_cols + c for c in cols)
+        for c in new_cols:
+            exposed.extend(r * self.num_cols + c for r in kept_rows)
+        return exposed
+
+    def fill_cell(self, row, column, color):
+        """ Fill one cell in its place of the ring image, when it is in the window """
+        if self.top <= row < self.top + self.view_rows and self.left <= column < self.left + self.view_cols:
+            super().fill_cell(row % self.view_rows, column % self.view_cols, color)
+
+    def mark(self, row, column, state):
+        """ Keep the minimap counts of snake and food cells up to date and repaint the pixel of the block """
+        cell_id = row * self.num_cols + column
+        old = self.occupied.get(cell_id, CellState.EMPTY)
+        if old == state:
+            return
+        block = (row // self.block_rows, column // self.block_cols)
+        for cell_state, change in ((old, -1), (state, 1)):
+            if cell_state == CellState.SNAKE or cell_state == CellState.SNAKE_HEAD:
+                self.snake_blocks[block] = self.snake_blocks.get(block, 0) + change
+            elif cell_state == CellState.FOOD:
+                self.food_blocks[block] = self.food_blocks.get(block, 0) + change
+        if state == CellState.EMPTY:
+            del self.occupied[cell_id]
+        else:
+            self.occupied[cell_id] = state
+        if self.snake_blocks.get(block, 0) > 0:
+            color = 'Blue'
+        elif self.food_blocks.get(block, 0) > 0:
+            color = 'Red'
+        else:
+            color = 'White'
+        if self.block_colors.get(block, 'White') != color:
+            self.block_colors[block] = color
+            self.minimap_image.put(color, to = (block[1], block[0], block[1] + 1, block[0] + 1))
+
+    def make_food(self, row, column):
+        """ Make cells with the state FOOD red """
+        self.mark(row, column, CellState.FOOD)
+        super().make_food(row, column)
+
+    def make_head(self, row, column):
+        """ Make cell with the state SNAKE_HEAD black """
+        self.mark(row, column, CellState.SNAKE_HEAD)
+        super().make_head(row, column)
+
+    def make_empty(self, row, column):
+        """ Make cells with the state EMPTY white """
+        self.mark(row, column, CellState.EMPTY)
+        super().make_empty(row, column)
+
+    def make_snake(self, row, column):
+        """ Make cells with the state SNAKE blue """
+        self.mark(row, column, CellState.SNAKE)
+        super().make_snake(row, column)
+
+    def reset(self):
+        """ Reset the window and the minimap, all cells empty """
+        super().reset()
+        if hasattr(self, "minimap_image"):
+            self.minimap_image.put('White', to = (0, 0, self.minimap_cols, self.minimap_rows))
+        self.occupied.clear()
+        self.snake_blocks.clear()
+        self.food_blocks.clear()
+        self.block_colors.clear()
+
 class SnakeModel:
-    """ This class keeps track of the snake game's rules. """
-    def __init__(self,num_cols,num_rows):
-        """ Initialize the model of the game """
+    """ 
+    This class keeps track of the snake game's rules. 
+    The board is one flat bytearray of CellState values where the cell at column x and row y has the id y * num_cols + x.
+    cell_list, snake_locations and food_cell give read-only Cell style access to it for the view and older code.
+    """
+    CELL_IDS = {}   # Array of the ids 0 .. n - 1 per number of cells n, copied to fill the pool of empty cells
+    CACHED_SIZES = 4    # Board sizes kept in the caches of the class, the least recently used one is dropped first
+    # Boards with more cells than this keep no pool of empty cells (two ints per cell), food is placed by
+    # drawing random cells until one is empty instead, which on such boards almost always takes one draw
+    POOL_MAX_CELLS = 1 << 22
+    SPARSE_ATTEMPTS = 32    # Random draws before falling back to a scan for an empty cell
+    # Moves come from a table of the neighbour of every cell in every direction, -1 past a wall, one per board size and
+    # wrap mode shared by all models, for the last CACHED_SIZES sizes used. Boards with more cells than this compute 
+    # the neighbour on every step instead
+    MOVE_TABLE_MAX_CELLS = 1 << 20
+    MOVE_TABLES = {}
+    DIRECTION_INDEX = {"N": 0, "E": 1, "S": 2, "W": 3}
+    def __init__(self,num_cols,num_rows,seed=None,wrap_mode=False):
+        """ 
+        Initialize the model of the game 
+        seed seeds the model's own random generator so a game can be played again exactly
+        """
         # To access list value it is [row][column] which is more or less xy
         self.num_rows = num_rows
         self.num_cols = num_cols
-        self.current_points = 0
-        self.WRAP_MODE = False
-        self.grow_check = False
+        self.WRAP_MODE = wrap_mode     # Also picks the move table, see the WRAP_MODE property
+        self.use_pool = num_rows * num_cols <= self.POOL_MAX_CELLS
+        # The random generator is only made and loaded from random_state when it is used, see the rng property
+        self.random_generator = None
+        self.random_state = None    # getstate() of the generator while it is not used, else None
+        self.random_stale = False   # True when random_state is newer than the generator
         
-        # Build array of cell objects
-        self.cell_list = []
-        for row in range(num_rows):
-            rowlist = []
-            for col in range(num_cols):
-                rowlist.append(Cell(CellState.EMPTY,col,row))
-            self.cell_list.append(rowlist)
-        self.next_direction = ""    
-        self.snake_locations = []   # List of Cell Objects, in order, where front is always snake head
-        self.food_cell = None   # Initialize food cell object
+        # One byte per cell
+        self.board = bytearray(num_rows * num_cols)
+        self.cell_list = CellGrid(self)
+        self.changed_cells = []     # Ids of the cells whose state changed during the last step
+        self.snake_body = deque()   # Ids of the snake's cells, in order, where front is always snake head
+        # Pool of ids of the empty cells, in no particular order, and the position of every id in the pool 
+        # (-1 when the cell is not empty). Kept up to date as the snake moves, so it is never rescanned
+        self.free_cells = array('i')
+        self.free_index = array('i')
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """ 
+        Start a new game on the same board, reusing its memory. seed reseeds the random generator like in __init__,
+        so SnakeModel(cols, rows, seed) and reset(seed) start the same game. WRAP_MODE is kept
+        """
+        self.clear_board(seed)
         self.random_snake_start()   # Gives snake location and direction
-        self.empty_cell_list = self.empty_Cells()   # Cell onjects not currently occupied by food or snake (0,0) is top left
         self.random_food()
+
+    def clear_board(self, seed=None):
+        """ Empty board, full pool of empty cells, no score, random generator seeded with seed """
+        num_cells = self.num_rows * self.num_cols
+        if self.random_generator is None:
+            self.random_generator = random.Random(seed)
+        else:
+            self.random_generator.seed(seed)
+        self.random_state = None
+        self.random_stale = False
+        self.current_points = 0
+        self.grow_check = False
+        self.next_direction = ""
+        self.food = -1  # Id of the food cell, -1 when there is no food
+        self.board[:] = bytes(num_cells)
+        self.changed_cells.clear()
+        self.snake_body.clear()
+        if not self.use_pool:
+            return
+        # Taken out and put back in so the dict stays in order of use
+        cell_ids = self.CELL_IDS.pop(num_cells, None)
+        if cell_ids is None:
+            cell_ids = array('i', range(num_cells))
+            if len(self.CELL_IDS) >= self.CACHED_SIZES:
+                del self.CELL_IDS[next(iter(self.CELL_IDS))]
+        self.CELL_IDS[num_cells] = cell_ids
+        self.free_cells[:] = self.free_index[:] = cell_ids
+
+    @property
+    def WRAP_MODE(self):
+        """ True when the snake comes back on the other side of the board instead of dying at the walls """
+        return self.wrap_mode
+
+    @WRAP_MODE.setter
+    def WRAP_MODE(self, wrap_mode):
+        """ Turn wraparound on or off, switching to the move table of that mode """
+        self.wrap_mode = bool(wrap_mode)
+        self.moves = self.move_table(self.num_rows, self.num_cols, self.wrap_mode)
+
+    @classmethod
+    def move_table(cls, num_rows, num_cols, wrap_mode):
+        """
+        Neighbour of every cell in every direction, at index cell_id * 4 + DIRECTION_INDEX[direction], wrapped 
+        in wrap mode and -1 past a wall otherwise. Built once per board size and mode, None for boards too big for one
+        """
+        num_cells = num_rows * num_cols
+        if num_cells > cls.MOVE_TABLE_MAX_CELLS:
+            return None
+        key = (num_rows, num_cols, wrap_mode)
+        # Taken out and put back in so the dict stays in order of use, with room for both modes of every size
+        table = cls.MOVE_TABLES.pop(key, None)
+        if table is None:
+            if len(cls.MOVE_TABLES) >= 2 * cls.CACHED_SIZES:
+                del cls.MOVE_TABLES[next(iter(cls.MOVE_TABLES))]
+            # Every direction is the id plus an offset, except on the edge it crosses
+            north = array('i', range(-num_cols, num_cells - num_cols))
+            east = array('i', range(1, num_cells + 1))
+            south = array('i', range(num_cols, num_cells + num_cols))
+            west = array('i', range(-1, num_cells - 1))
+            if wrap_mode:
+                north[:num_cols] = array('i', range(num_cells - num_cols, num_cells))
+                east[num_cols - 1::num_cols] = array('i', range(0, num_cells, num_cols))
+                south[num_cells - num_cols:] = array('i', range(num_cols))
+                west[::num_cols] = array('i', range(num_cols - 1, num_cells, num_cols))
+            else:
+                north[:num_cols] = array('i', [-1]) * num_cols
+                east[num_cols - 1::num_cols] = array('i', [-1]) * num_rows
+                south[num_cells - num_cols:] = array('i', [-1]) * num_cols
+                west[::num_cols] = array('i', [-1]) * num_rows
+            table = array('i', bytes(16 * num_cells))
+            for index, direction in enumerate((north, east, south, west)):
+                table[index::4] = direction
+        cls.MOVE_TABLES[key] = table
+        return table
+
+    def neighbour(self, cell_id, direction):
+        """ Cell next to cell_id in direction N, E, S or W, wrapped in wrap mode, or -1 past a wall """
+        index = self.DIRECTION_INDEX[direction]
+        if self.moves is not None:
+            return self.moves[cell_id * 4 + index]
+        y = cell_id // self.num_cols + (-1, 0, 1, 0)[index]
+        x = cell_id % self.num_cols + (0, 1, 0, -1)[index]
+        if self.wrap_mode:
+            y %= self.num_rows
+            x %= self.num_cols
+        elif not (0 <= y < self.num_rows and 0 <= x < self.num_cols):
+            return -1
+        return y * self.num_cols + x
+
+    @property
+    def snake_locations(self):
+        """ Cells of the snake, in order, where front is always snake head """
+        return SnakeCells(self)
+
+    @property
+    def food_cell(self):
+        """ Cell of the food, or None when there is no food """
+        if self.food < 0:
+            return None
+        return BoardCell(self, self.food % self.num_cols, self.food // self.num_cols)
+
+    @property
+    def empty_cell_list(self):
+        """ Cell objects not currently occupied by food or snake (0,0) is top left """
+        if self.use_pool:
+            free_cells = self.free_cells
+        else:
+            free_cells = [cell_id for cell_id, state in enumerate(self.board) if state == CellState.EMPTY]
+        return [BoardCell(self, cell_id % self.num_cols, cell_id // self.num_cols) for cell_id in free_cells]
+
+    def add_free_cell(self, cell_id):
+        """ Put a cell that just became empty into the pool in O(1) """
+        if not self.use_pool:
+            return
+        self.free_index[cell_id] = len(self.free_cells)
+        self.free_cells.append(cell_id)
+
+    def remove_free_cell(self, cell_id):
+        """ Take a cell out of the pool in O(1) by moving the last id of the pool into its place """
+        if not self.use_pool:
+            return
+        position = self.free_index[cell_id]
+        if position < 0:
+            return
+        last = self.free_cells.pop()
+        if last != cell_id:
+            self.free_cells[position] = last
+            self.free_index[last] = position
+        self.free_index[cell_id] = -1
+    
+    @property
+    def rng(self):
+        """ 
+        The model's random generator. Snapshots and clones share one saved state of the generator for as long as 
+        nobody draws from it, so taking the generator loads that state if needed and counts as drawing from it
+        """
+        if self.random_stale:
+            if self.random_generator is None:
+                self.random_generator = random.Random(0)
+            self.random_generator.setstate(self.random_state)
+            self.random_stale = False
+        self.random_state = None
+        return self.random_generator
+
+    def rng_state(self):
+        """ getstate() of the random generator, only computed again after the generator was used """
+        if self.random_state is None:
+            self.random_state = self.random_generator.getstate()
+        return self.random_state
+
+    def snapshot(self):
+        """ 
+        Copy of the whole state of the game (board, body, food, direction, score, free cells, random generator)
+        made of bytes, arrays, tuples and numbers only. restore puts a model back into that state.
+        """
+        return (bytes(self.board), tuple(self.snake_body), self.food, self.next_direction, self.grow_check,
+                self.current_points, self.WRAP_MODE, self.free_cells[:], self.free_index[:], self.rng_state())
+
+    def restore(self, state):
+        """ Go back to a state made by snapshot of a model with the same board size """
+        (board, snake_body, self.food, self.next_direction, self.grow_check, self.current_points, 
+         self.WRAP_MODE, free_cells, free_index, rng_state) = state
+        # Copy into the existing board and arrays, so views of self.board stay valid and nothing is allocated
+        self.board[:] = board
+        self.snake_body.clear()
+        self.snake_body.extend(snake_body)
+        self.free_cells[:] = free_cells
+        self.free_index[:] = free_index
+        if rng_state is not self.random_state:
+            self.random_state = rng_state
+            self.random_stale = True
+        self.changed_cells.clear()
+
+    def clone(self):
+        """ 
+        Independent copy of the game, for search that tries moves on copies. Costs a few copies of the board's 
+        size and no new random generator until the copy draws from it
+        """
+        other = type(self).__new__(type(self))
+        other.num_rows = self.num_rows
+        other.num_cols = self.num_cols
+        other.wrap_mode = self.wrap_mode
+        other.moves = self.moves
+        other.use_pool = self.use_pool
+        other.current_points = self.current_points
+        other.grow_check = self.grow_check
+        other.next_direction = self.next_direction
+        other.food = self.food
+        other.board = bytearray(self.board)
+        other.cell_list = CellGrid(other)
+        other.changed_cells = []
+        other.snake_body = deque(self.snake_body)
+        other.free_cells = self.free_cells[:]
+        other.free_index = self.free_index[:]
+        other.random_state = self.rng_state()
+        other.random_stale = True
+        other.random_generator = None
+        return other
     
     def random_food(self):
-        """ Pops a random element from the empty cell list. Make sure empty cell list is up to date before calling this """
-        # Get cell is no longer empty
-        popd = self.empty_cell_list.pop(random.randrange(len(self.empty_cell_list)))
-        # Change State in the cell_list
-        self.cell_list[popd.y][popd.x].cell_state = CellState.FOOD
-        self.food_cell = popd
+        """ Takes a random cell out of the pool of empty cells and puts the food there """
+        cell_id = self.random_empty_cell()
+        if cell_id < 0:
+            # The snake fills the whole board, there is nowhere left for food
+            self.food = -1
+            return
+        self.remove_free_cell(cell_id)
+        # Change State on the board
+        self.board[cell_id] = CellState.FOOD
+        self.food = cell_id
+        self.changed_cells.append(cell_id)
     
+    def random_empty_cell(self):
+        """ Id of a random empty cell, from the pool or on boards without one by drawing random cells, -1 if none """
+        if self.use_pool:
+            if not self.free_cells:
+                return -1
+            return self.free_cells[self.rng.randrange(len(self.free_cells))]
+        board = self.board
+        rng = self.rng
+        for attempt in range(self.SPARSE_ATTEMPTS):
+            cell_id = rng.randrange(len(board))
+            if board[cell_id] == CellState.EMPTY:
+                return cell_id
+        # Nearly full board: the first empty cell after a random one
+        start = rng.randrange(len(board))
+        cell_id = board.find(CellState.EMPTY, start)
+        if cell_id < 0:
+            cell_id = board.find(CellState.EMPTY, 0, start)
+        return cell_id
+
     def random_snake_start(self):
         """ As per start up we pick a random cell and have it be the head """
-        # Randomly select cell onject from a list of lists
-        snake_start = random.choice(random.choice(self.cell_list))
-#       Update Cell List
-        self.cell_list[snake_start.y][snake_start.x].cell_state = CellState.SNAKE_HEAD
-#       Insert snake_start in snake locations
-        copy_start = copy.deepcopy(snake_start)
-        self.snake_locations.append(copy_start)
+        # Randomly select a row, then a cell in that row
+        snake_y = self.rng.choice(range(self.num_rows))
+        snake_x = self.rng.choice(range(self.num_cols))
+        start = snake_y * self.num_cols + snake_x
+#       Update the board
+        self.board[start] = CellState.SNAKE_HEAD
+#       Insert the start in the snake body
+        self.snake_body.append(start)
+        self.remove_free_cell(start)
 #       Calculate Initial Direction
-        top,left = snake_start.y,snake_start.x
-        bott,right = self.num_rows - snake_start.y, self.num_cols - snake_start.x
+        top,left = snake_y,snake_x
+        bott,right = self.num_rows - snake_y, self.num_cols - snake_x
         var = {top:"N",bott:"S",left:"W",right:"E"}
         self.next_direction = var.get(max(var))
         
     def empty_Cells(self):
         """
-        Calculates the empty cells in self.cell_state for use
-        Updates and Returns empty_cells, a list of all the empty cells on the board
+        Calculates the empty cells on the board for use
+        Rebuilds the pool of empty cells from scratch and returns empty_cells, a list of all the empty cells on the board.
+        The pool is kept up to date on every step, so this is only needed after editing the board by hand.
         """
-        empty_cells = []
-        for col in self.cell_list:
-            for element in col:
-                if element.cell_state == CellState.EMPTY:
-                    empty_cells.append(element)
-        self.empty_cell_list = empty_cells
-        return empty_cells
+        if not self.use_pool:
+            return self.empty_cell_list
+        self.free_cells = array('i')
+        self.free_index = array('i', [-1]) * len(self.board)
+        for cell_id, state in enumerate(self.board):
+            if state == CellState.EMPTY:
+                self.add_free_cell(cell_id)
+        return self.empty_cell_list
 
     def next_step(self):
-        """ Move snake in direction, check for events such as food or death, update open cells, update score. """
-        self.move2()
+        """ 
+        Move snake in direction, check for events such as food or death, update open cells, update score.
+        Returns the StepOutcome. The ids of the cells whose state changed during this step (new head, old head, 
+        vacated tail, eaten food and new food) are in changed_cells, so the view only has to repaint those.
+        A move that kills the snake leaves the board as it was. changed_cells is the same list every step, 
+        cleared at its start, so callers that keep the ids copy them
+        """
+        self.changed_cells.clear()
+        outcome = self.move2()
+        if outcome != MOVED:
+            return outcome
         self.grow_check = False
-        self.check_events()
-        return self.cell_list, self.current_points
+        return self.check_events()
     
     def eat(self):
         """" Makes snake bigger and eats """
         # Increase Size
         self.grow2()
-        self.empty_Cells()
         self.random_food()
         self.current_points += 1
         
-    def die(self):
-        """ Ends the game when snake dies """
-        raise Exception("User Died")
-        
     def change_direction(self, direction):
         """
         Param: Self, Direction in a string N,S,E,W
@@ -434,84 +1146,161 @@ class SnakeModel:
         self.grow_check = True
     
     def move2(self):
-        """ Move snake in user-chosen direction """
-        try:
-            snake_x = self.snake_locations[0].x
-            snake_y = self.snake_locations[0].y
-            
-            if len(self.snake_locations) > 1:
-                self.cell_list[snake_y][snake_x].cell_state = CellState.SNAKE
-                
-            if self.next_direction== "N":
-                snake_y -= 1 #increment Y up one
-            if self.next_direction== "S":
-                snake_y += 1 #increment Y down one
-            if self.next_direction== "E":
-                snake_x += 1 #increment X up one
-            if self.next_direction== "W":
-                snake_x -= 1 #increment X down one
-            if snake_x < 0 or snake_y <0 : 
-                raise Exception("Death or Wrap")
-                
-            self.cell_list[snake_y][snake_x].cell_state
-            new_head = Cell(CellState.SNAKE_HEAD,snake_x,snake_y)
-            self.snake_locations.insert(0,new_head)
-            self.check_valid(new_head)
-            self.cell_list[snake_y][snake_x].cell_state = CellState.SNAKE_HEAD
-        
-        except IndexError:
-            if self.WRAP_MODE:
-                if self.next_direction == "N" :
-                    snake_y = self.num_rows - 1
-                if self.next_direction == "S":
-                    snake_y = 0
-                if self.next_direction == "W" :
-                    snake_x = self.num_cols - 1
-                if self.next_direction == "E":
-                    snake_x = 0
-                new_head = Cell(CellState.SNAKE_HEAD,snake_x,snake_y)
-                self.snake_locations.insert(0,new_head)
-                self.check_valid(new_head)
-                self.cell_list[snake_y][snake_x].cell_state = CellState.SNAKE_HEAD
-            else: 
-                self.die()
-                raise Exception("Death")
+        """ Move snake in user-chosen direction. Returns DIED_WALL or DIED_SELF, without moving, when that kills it """
+        board = self.board
+        head = self.snake_body[0]
+        if self.moves is not None:
+            new_head = self.moves[head * 4 + self.DIRECTION_INDEX[self.next_direction]]
+        else:
+            new_head = self.neighbour(head, self.next_direction)
+        if new_head < 0:
+            return DIED_WALL
+        # The snake occupies the cell, read from the board in O(1)
+        if board[new_head] == SNAKE:
+            return DIED_SELF
+        if len(self.snake_body) > 1:
+            board[head] = SNAKE
+            self.changed_cells.append(head)
+        board[new_head] = SNAKE_HEAD
+        self.snake_body.appendleft(new_head)
+        self.remove_free_cell(new_head)
+        self.changed_cells.append(new_head)
         if not self.grow_check:
-            self.cell_list[self.snake_locations[-1].y][self.snake_locations[-1].x].cell_state = CellState.EMPTY
-            self.snake_locations.pop()
+            tail = self.snake_body.pop()
+            board[tail] = EMPTY
+            self.add_free_cell(tail)
+            self.changed_cells.append(tail)
         else:
-            self.cell_list[self.snake_locations[0].y][self.snake_locations[0].x].cell_state = CellState.SNAKE
-            self.snake_locations[1].cell_state = CellState.SNAKE
+            # The head stays the head, the old head becomes body (it is still SNAKE_HEAD if the snake had length 1)
+            board[self.snake_body[1]] = SNAKE
+            self.changed_cells.append(self.snake_body[1])
+        return MOVED
     
-    def check_valid(self,location):
-        """Param: Self, and Cell Object of location that you wish to move into
-        Checkes to see if anything currently occupies the cell
-        """
-        if self.cell_list[location.y][location.x].cell_state == CellState.SNAKE:
-            self.die()
     def check_events(self):
         """
-        Check if:
-            SnakeHead hit itself
-            SnakeHead out of bounds
-            Snake landed on food
+        Check if the snake landed on food, returns ATE or MOVED. 
+        Walls and the snake hitting itself are already caught by move2 before the head moves
         """
+        head = self.snake_body[0]
 #       Hit food
-        if self.snake_locations[0] == self.food_cell or self.food_cell.cell_state != CellState.FOOD:
+        if self.food >= 0 and (head == self.food or self.board[self.food] != FOOD):
             self.eat()
-#       Hit wall 
-        if (self.snake_locations[0].x > self.num_cols or self.snake_locations[0].y > self.num_rows 
-            or self.snake_locations[0].x < 0 or self.snake_locations[0].y < 0):
-            self.die()
-#       Runs into self
-        head = self.snake_locations[0]
-        for location in range(len(self.snake_locations)):
-            # Head will obviously match itself
-            if location > 0 and head == self.snake_locations[location]:
-                self.die()
+            return ATE
+        return MOVED
+
+class StepTimings:
+    """ 
+    Fixed-size ring buffer with the timing of the last steps of the game, in seconds: time spent in the model,
+    time spent repainting, the tick interval that was scheduled, the one that really happened, and the jitter 
+    between the two. 
+    """
+    FIELDS = ("model", "render", "scheduled", "actual", "jitter")
+    def __init__(self, capacity = 1024):
+        """ Keep the last capacity steps """
+        self.capacity = capacity
+        self.count = 0      # Steps recorded so far, the buffer holds the last min(count, capacity)
+        self.columns = dict((name, array('d', bytes(8 * capacity))) for name in self.FIELDS)
+
+    def record(self, model, render, scheduled, actual):
+        """ Add one step, overwriting the oldest one when the buffer is full """
+        index = self.count % self.capacity
+        columns = self.columns
+        columns["model"][index] = model
+        columns["render"][index] = render
+        columns["scheduled"][index] = scheduled
+        columns["actual"][index] = actual
+        columns["jitter"][index] = actual - scheduled
+        self.count += 1
+
+    def values(self, name):
+        """ The recorded values of one field, oldest first """
+        column = self.columns[name]
+        if self.count <= self.capacity:
+            return list(column[:self.count])
+        index = self.count % self.capacity
+        return list(column[index:]) + list(column[:index])
+
+    def percentiles(self, name, points = (50, 95, 99)):
+        """ Percentiles of one field, nearest rank """
+        values = sorted(self.values(name))
+        if not values:
+            return [0.0 for point in points]
+        return [values[min(len(values) - 1, len(values) * point // 100)] for point in points]
+
+    def rows(self):
+        """ The recorded steps, oldest first, as tuples in the order of FIELDS """
+        return list(zip(*(self.values(name) for name in self.FIELDS)))
+
+    def export(self, path):
+        """ Save the recorded steps, as JSON when path ends in .json and as CSV otherwise """
+        with open(path, "w", newline = "") as timings_file:
+            if path.endswith(".json"):
+                json.dump({"fields": self.FIELDS, "steps": self.rows(),
+                           "percentiles": dict((name, self.percentiles(name)) for name in self.FIELDS)},
+                          timings_file, indent = 1)
+            else:
+                writer = csv.writer(timings_file)
+                writer.writerow(self.FIELDS)
+                writer.writerows(self.rows())
+
+class InputLatencies(StepTimings):
+    """ Ring buffer with the time from an arrow key press to the repaint that showed the turn, in seconds """
+    FIELDS = ("latency",)
+    def record(self, latency):
+        """ Add one turn, overwriting the oldest one when the buffer is full """
+        self.columns["latency"][self.count % self.capacity] = latency
+        self.count += 1
+
+class TurnQueue:
+    """ 
+    Bounded queue of the turns pressed but not stepped yet, one is used per step. A turn that would reverse
+    the snake onto itself, or repeats the direction it will already have, is dropped, and so are turns 
+    pressed while the queue is full.
+    """
+    OPPOSITE = {"N": "S", "S": "N", "E": "W", "W": "E"}
+    def __init__(self, capacity = 3):
+        """ Queue at most capacity turns """
+        self.capacity = capacity
+        self.turns = deque()
+
+    def __len__(self):
+        """ Number of turns waiting """
+        return len(self.turns)
+
+    def push(self, direction, current, pressed = 0.0):
+        """ 
+        Queue direction, pressed at time pressed, for a snake now heading to current. 
+        Returns False when the turn is dropped 
+        """
+        last = self.turns[-1][0] if self.turns else current
+        if len(self.turns) >= self.capacity or direction == last or self.OPPOSITE.get(direction) == last:
+            return False
+        self.turns.append((direction, pressed))
+        return True
+
+    def pop(self):
+        """ The oldest turn as (direction, pressed) """
+        return self.turns.popleft()
+
+    def clear(self):
+        """ Forget the waiting turns """
+        self.turns.clear()
+
+class StepOutcome(IntEnum):
+    """ 
+    What one SnakeModel.next_step did. The deaths come last, so outcome >= DIED_WALL means the game is over
+    """
+    MOVED = 0
+    ATE = 1
+    DIED_WALL = 2
+    DIED_SELF = 3
+
+# Cause of death of the outcomes that end the game, as reported by run_headless
+DEATH_CAUSES = {StepOutcome.DIED_WALL: "wall", StepOutcome.DIED_SELF: "self"}
 
 class Cell():
     """ This class defines a cell by location and by state """
+    __slots__ = ("cell_state", "x", "y")
     def __init__(self,state,xcord,ycord):
         """ Initializes cell object """
         self.cell_state = state
@@ -525,6 +1314,89 @@ class Cell():
         """ Returns representation of cell object as a string """
         return str(self)
 
+class BoardCell:
+    """ Read-only Cell that looks its state up on the board of a SnakeModel, so a board does not need a Cell per cell """
+    __slots__ = ("model", "x", "y")
+    def __init__(self, model, xcord, ycord):
+        """ Initializes a view of the cell at xcord, ycord of model """
+        self.model = model
+        self.x = xcord
+        self.y = ycord
+
+    @property
+    def cell_state(self):
+        """ State of the cell, read from the board """
+        return CellState(self.model.board[self.y * self.model.num_cols + self.x])
+
+    def __eq__(self, other):
+        """ Two cells are equal when they are at the same place """
+        return isinstance(other, (Cell, BoardCell)) and self.x == other.x and self.y == other.y
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def __str__(self):
+        """ Prints out a cell in format: STATE[x, y] """
+        return ((str(self.cell_state))[10:] + str([self.x,self.y]))
+    def __repr__(self):
+        """ Returns representation of cell as a string """
+        return str(self)
+
+class CellGrid:
+    """ Read-only list of rows of BoardCells, so cell_list[row][column] keeps working on the flat board """
+    __slots__ = ("model",)
+    def __init__(self, model):
+        self.model = model
+
+    def __len__(self):
+        return self.model.num_rows
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.model.num_rows:
+            raise IndexError(row)
+        return CellRow(self.model, row)
+
+    def __iter__(self):
+        for row in range(self.model.num_rows):
+            yield CellRow(self.model, row)
+
+class CellRow:
+    """ One row of a CellGrid, which only builds the BoardCell that is asked for """
+    __slots__ = ("model", "row")
+    def __init__(self, model, row):
+        self.model = model
+        self.row = row
+
+    def __len__(self):
+        return self.model.num_cols
+
+    def __getitem__(self, col):
+        if not 0 <= col < self.model.num_cols:
+            raise IndexError(col)
+        return BoardCell(self.model, col, self.row)
+
+    def __iter__(self):
+        for col in range(self.model.num_cols):
+            yield BoardCell(self.model, col, self.row)
+
+class SnakeCells:
+    """ Read-only sequence of BoardCells over snake_body, head first, which builds one cell per access """
+    __slots__ = ("model",)
+    def __init__(self, model):
+        self.model = model
+
+    def __len__(self):
+        return len(self.model.snake_body)
+
+    def __getitem__(self, index):
+        cell_id = self.model.snake_body[index]
+        return BoardCell(self.model, cell_id % self.model.num_cols, cell_id // self.model.num_cols)
+
+    def __iter__(self):
+        num_cols = self.model.num_cols
+        for cell_id in self.model.snake_body:
+            yield BoardCell(self.model, cell_id % num_cols, cell_id // num_cols)
+
 class CellState(IntEnum):
     """ 
     Use IntEnum so that the board cells can be classified as either EMPTY, SNAKE, SNAKE_HEAD or FOOD
@@ -533,10 +1405,328 @@ class CellState(IntEnum):
     SNAKE = 1
     SNAKE_HEAD = 2
     FOOD = 3   
+
+# The members read on every step as module level names, which is several times faster than CellState.SNAKE
+EMPTY, SNAKE, SNAKE_HEAD, FOOD = CellState
+MOVED, ATE, DIED_WALL, DIED_SELF = StepOutcome
+
+def run_headless(seed=None, num_rows=30, num_cols=30, wrap_mode=False, policy=None, max_steps=100000):
+    """
+    Play one game on a SnakeModel without tkinter, as fast as possible.
+    policy is called with the model before every step and returns a direction N,S,E,W or None to keep going straight.
+    Stops when the snake dies or after max_steps. Returns a dict with the score, the length, the number of steps,
+    the cause of death ("wall", "self" or None), the wall time and the steps per second.
+    """
+    model = SnakeModel(num_cols, num_rows, seed, wrap_mode)
+    next_step = model.next_step
+    first_death = StepOutcome.DIED_WALL    # Outcomes from this one on end the game
+    outcome = StepOutcome.MOVED
+    steps = 0
+    start = time.perf_counter()
+    if policy is None:
+        while steps < max_steps:
+            outcome = next_step()
+            if outcome >= first_death:
+                break
+            steps += 1
+    else:
+        change_direction = model.change_direction
+        while steps < max_steps:
+            direction = policy(model)
+            if direction is not None:
+                change_direction(direction)
+            outcome = next_step()
+            if outcome >= first_death:
+                break
+            steps += 1
+    cause = DEATH_CAUSES.get(outcome)
+    died = cause is not None
+    seconds = time.perf_counter() - start
+    return {"seed": seed, "points": model.current_points, "length": len(model.snake_body),
+            "steps": steps, "died": died, "cause": cause, "seconds": seconds, 
+            "steps_per_sec": steps / seconds if seconds > 0 else 0.0}
+
+def main(argv = None):
+    """ 
+    Play the game in a window, or with --headless run games without tkinter and print their statistics. 
+    The steps/sec of the headless games is only printed when they made at least --rate-steps steps between them,
+    as a snake going straight into a wall dies within a few dozen steps, too few to time
+    """
+    parser = argparse.ArgumentParser(description = "Snake game")
+    parser.add_argument("--headless", action = "store_true", help = "run games without a window")
+    parser.add_argument("--rows", type = int, default = 30)
+    parser.add_argument("--cols", type = int, default = 30)
+    parser.add_argument("--seed", type = int, default = None)
+    parser.add_argument("--wrap", action = "store_true", help = "start with wraparound on")
+    parser.add_argument("--steps", type = int, default = 100000, help = "maximum steps per headless game")
+    parser.add_argument("--games", type = int, default = 1, help = "number of headless games")
+    parser.add_argument("--policy", default = None, 
+                        help = "headless policy as module:function, default keeps going straight")
+    parser.add_argument("--rate-steps", type = int, default = 100000, 
+                        help = "fewest steps of all headless games together for a steps/sec figure")
+    parser.add_argument("--timings", default = None, 
+                        help = "show step timings and save them to this .csv or .json file on quit")
+    parser.add_argument("--turn-steps", action = "store_true", help = "step at once on every turn")
+    parser.add_argument("--max-catch-up", type = int, default = 5, 
+                        help = "most steps run in one tick when the game falls behind")
+    parser.add_argument("--viewport", action = "store_true", 
+                        help = "show a window around the head and a minimap, even when the board fits on the screen")
+    args = parser.parse_args(argv)
+    if not args.headless:
+        Snake(args.rows, args.cols, SnakeViewportView if args.viewport else None, instrument = args.timings is not None, 
+              timings_path = args.timings, turn_steps = args.turn_steps, max_catch_up = args.max_catch_up)
+        return
+    from snake_tournament import load_policy     # Imported here as snake_tournament imports this module
+    policy = load_policy(args.policy)
+    steps = seconds = 0
+    for game in range(args.games):
+        seed = None if args.seed is None else args.seed + game
+        result = run_headless(seed, args.rows, args.cols, args.wrap, policy, args.steps)
+        steps += result["steps"]
+        seconds += result["seconds"]
+        print("seed {seed}: {points} points, length {length}, {steps} steps, died {died}".format(**result))
+    if steps >= args.rate_steps and seconds > 0:
+        print("{} steps in {:.3f} s: {:.0f} steps/sec".format(steps, seconds, steps / seconds))
+    else:
+        print("{} steps are too few to time (--rate-steps {}), try --wrap, --policy or more --games".format(
+              steps, args.rate_steps))
+
 class SnakeModelTest(unittest.TestCase):
     """ 
     For testing the methods of the SnakeModel class.
     """
+    def test_headlessSeeded(self):
+        turns = "NESW"
+        policy = lambda model: turns[model.current_points % 4] if model.current_points else None
+        first = run_headless(7, 12, 12, True, policy, 5000)
+        second = run_headless(7, 12, 12, True, policy, 5000)
+        for key in ("points", "length", "steps", "died"):
+            self.assertEqual(first[key], second[key])
+
+    def test_catchUp(self):
+        class RecordingView:
+            """ Stands in for SnakeView without a window and records the delays steps are scheduled with """
+            def __init__(self, num_rows, num_cols):
+                self.delays = []
+                self.newtime = 0
+            def schedule_next_step(self, delay_millis, handler):
+                self.delays.append(delay_millis)
+            def follow(self, row, col):
+                return []
+            def __getattr__(self, name):
+                # Handlers, labels and painting do nothing
+                return self
+            def __call__(self, *args, **kwargs):
+                return None
+        now = [0.0]
+        perf_counter = time.perf_counter
+        time.perf_counter = lambda: now[0]
+        try:
+            game = Snake(10, 10, RecordingView, run = False, max_catch_up = 3)
+            game.Model.WRAP_MODE = True
+            steps = []
+            next_step = game.Model.next_step
+            game.Model.next_step = lambda: steps.append(now[0]) or next_step()
+            game.STEPTIME_MILLIS = 125
+            game.start_handler()
+            # Every tick fires 25 ms after its deadline and runs one step, the next is still due on time
+            for tick in range(1, 4):
+                now[0] = tick * 0.125 + 0.025
+                game.continue_simulation()
+            self.assertEqual(game.view.delays, [125, 100, 100, 100])
+            self.assertEqual(len(steps), 3)
+            self.assertEqual(game.ticks_done, 3)
+            # After a 1 s stall the 8 missed deadlines are skipped past, with 3 steps run
+            now[0] += 1.0
+            game.continue_simulation()
+            self.assertEqual(len(steps), 6)
+            self.assertEqual(game.ticks_done, 11)
+            self.assertEqual(game.view.delays[-1], 100)
+        finally:
+            time.perf_counter = perf_counter
+
+    def test_headlessMain(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(["--headless", "--seed", "1", "--games", "2"])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn("too few to time", lines[-1])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(["--headless", "--seed", "1", "--rows", "10", "--cols", "10", "--steps", "1000", "--rate-steps", "1000",
+                  "--policy", "snake_autopilot:autopilot"])
+        lines = output.getvalue().splitlines()
+        self.assertIn("1000 steps, died False", lines[0])
+        self.assertIn("steps/sec", lines[-1])
+
+    def test_freeCellPool(self):
+        model = SnakeModel(8, 8, 5, True)
+        turns = "NESW"
+        for step in range(400):
+            if step % 7 == 0:
+                model.change_direction(turns[step % 4])
+            if model.next_step() >= StepOutcome.DIED_WALL:
+                break
+            empty = set((cell.y, cell.x) for row in model.cell_list for cell in row 
+                        if cell.cell_state == CellState.EMPTY)
+            self.assertEqual(empty, set((cell.y, cell.x) for cell in model.empty_cell_list))
+            self.assertEqual(len(model.free_cells), len(empty))
+
+    def test_lazyCells(self):
+        model = SnakeModel(9, 6, 2, True)
+        for step in range(3):
+            model.next_step()
+        row = model.cell_list[4]
+        self.assertEqual(len(model.cell_list), 6)
+        self.assertEqual(len(row), 9)
+        self.assertEqual((row[7].x, row[7].y), (7, 4))
+        self.assertRaises(IndexError, row.__getitem__, 9)
+        self.assertEqual(len(list(model.cell_list)), 6)
+        locations = model.snake_locations
+        self.assertEqual(len(locations), len(model.snake_body))
+        head = model.snake_body[0]
+        self.assertEqual((locations[0].x, locations[0].y), (head % 9, head // 9))
+        self.assertEqual([cell.y * 9 + cell.x for cell in locations], list(model.snake_body))
+        self.assertEqual(locations[0].cell_state, CellState.SNAKE_HEAD)
+
+    def test_boundedCaches(self):
+        for num_cols in range(3, 3 + 2 * SnakeModel.CACHED_SIZES):
+            SnakeModel(num_cols, 3, 1)
+            self.assertLessEqual(len(SnakeModel.CELL_IDS), SnakeModel.CACHED_SIZES)
+        self.assertIn(3 * num_cols, SnakeModel.CELL_IDS)
+        self.assertNotIn(9, SnakeModel.CELL_IDS)
+        for num_cols in range(3, 3 + 2 * SnakeModel.CACHED_SIZES):
+            for wrap_mode in (False, True):
+                SnakeModel(num_cols, 3, 1, wrap_mode)
+                self.assertLessEqual(len(SnakeModel.MOVE_TABLES), 2 * SnakeModel.CACHED_SIZES)
+        self.assertIs(SnakeModel.move_table(3, num_cols, True), SnakeModel.MOVE_TABLES[(3, num_cols, True)])
+        self.assertNotIn((3, 3, False), SnakeModel.MOVE_TABLES)
+
+    def test_sparseBoard(self):
+        class SparseModel(SnakeModel):
+            POOL_MAX_CELLS = 0
+        model = SparseModel(6, 6, 3, True)
+        self.assertFalse(model.use_pool)
+        turns = "NESW"
+        for step in range(400):
+            if step % 5 == 0:
+                model.change_direction(turns[step % 4])
+            if model.next_step() >= StepOutcome.DIED_WALL:
+                break
+            self.assertEqual(model.board.count(CellState.FOOD), 1 if model.food >= 0 else 0)
+            self.assertEqual(len(model.empty_cell_list), model.board.count(CellState.EMPTY))
+        self.assertEqual(len(model.free_cells), 0)
+        # With one empty cell left the scan after the random draws finds it
+        model.board[:] = bytes([CellState.SNAKE]) * len(model.board)
+        model.board[17] = CellState.EMPTY
+        self.assertEqual(model.random_empty_cell(), 17)
+        model.board[17] = CellState.SNAKE
+        self.assertEqual(model.random_empty_cell(), -1)
+
+    def test_selfCollision(self):
+        model = SnakeModel(10, 10, 1, True)
+        # Lay a snake of length 4 along row 5 with the head at x = 3 moving east
+        for cell_id in model.snake_body:
+            model.board[cell_id] = CellState.EMPTY
+        model.snake_body.clear()
+        for x in range(3, -1, -1):
+            model.board[5 * 10 + x] = CellState.SNAKE
+            model.snake_body.append(5 * 10 + x)
+        model.board[5 * 10 + 3] = CellState.SNAKE_HEAD
+        # Put the food in the far corner, out of the way of the turn
+        if model.food >= 0:
+            model.board[model.food] = CellState.EMPTY
+        model.food = 9 * 10 + 9
+        model.board[model.food] = CellState.FOOD
+        model.empty_Cells()
+        # South, west, then north into the body
+        for direction in "SW":
+            model.change_direction(direction)
+            self.assertEqual(model.next_step(), StepOutcome.MOVED)
+        model.change_direction("N")
+        board = bytes(model.board)
+        self.assertEqual(model.next_step(), StepOutcome.DIED_SELF)
+        self.assertEqual(bytes(model.board), board)
+
+    def test_wrapAllEdges(self):
+        for direction in "NSEW":
+            model = SnakeModel(5, 5, 3, True)
+            model.change_direction(direction)
+            for step in range(6):
+                self.assertLess(model.next_step(), StepOutcome.DIED_WALL)
+
+    def test_walls(self):
+        for direction in "NESW":
+            model = SnakeModel(5, 4, 3)
+            model.change_direction(direction)
+            outcomes = [model.next_step() for step in range(6)]
+            self.assertEqual(outcomes[-1], StepOutcome.DIED_WALL)
+            self.assertEqual(run_headless(3, 4, 5, False, lambda model: direction)["cause"], "wall")
+        # The move table and the computed neighbours agree, with and without walls
+        for wrap_mode in (False, True):
+            model = SnakeModel(7, 3, 1, wrap_mode)
+            moves = model.moves
+            model.moves = None
+            for cell_id in range(21):
+                for index, direction in enumerate("NESW"):
+                    self.assertEqual(model.neighbour(cell_id, direction), moves[cell_id * 4 + index])
+        model.WRAP_MODE = False
+        self.assertIs(model.moves, SnakeModel.move_table(3, 7, False))
+
+    def test_stepTimings(self):
+        timings = StepTimings(capacity = 10)
+        for step in range(25):
+            timings.record(step, 2 * step, 0.1, 0.1 + step)
+        self.assertEqual(timings.values("model"), list(range(15, 25)))
+        self.assertEqual(timings.percentiles("model", (50, 99)), [20, 24])
+        self.assertAlmostEqual(timings.rows()[-1][4], 24)
+
+    def test_reset(self):
+        model = SnakeModel(9, 7, 4, True)
+        board = model.board
+        for step in range(30):
+            if model.next_step() >= StepOutcome.DIED_WALL:
+                break
+        model.reset(11)
+        fresh = SnakeModel(9, 7, 11, True)
+        self.assertIs(model.board, board)
+        self.assertEqual(model.snapshot(), fresh.snapshot())
+
+    def test_cloneAndRestore(self):
+        model = SnakeModel(6, 6, 9, True)
+        state = model.snapshot()
+        copy = model.clone()
+        for step in range(60):
+            model.change_direction("NESW"[step // 5 % 4])
+            copy.change_direction("NESW"[step // 5 % 4])
+            outcome = model.next_step()
+            self.assertEqual(copy.next_step(), outcome)
+            if outcome >= StepOutcome.DIED_WALL:
+                break
+            self.assertEqual(copy.snapshot(), model.snapshot())
+        self.assertGreater(model.current_points, 0)
+        self.assertIsNot(copy.board, model.board)
+        fresh = SnakeModel(6, 6, 9, True)
+        model.restore(state)
+        self.assertEqual(model.snapshot(), fresh.snapshot())
+        self.assertEqual(model.rng.random(), fresh.rng.random())
+
+    def test_turnQueue(self):
+        turns = TurnQueue(capacity = 2)
+        self.assertFalse(turns.push("S", "N"))
+        self.assertFalse(turns.push("N", "N"))
+        self.assertTrue(turns.push("E", "N", 1.0))
+        self.assertFalse(turns.push("W", "N"))
+        self.assertTrue(turns.push("S", "N", 2.0))
+        self.assertFalse(turns.push("W", "N"))
+        self.assertEqual(turns.pop(), ("E", 1.0))
+        self.assertEqual(len(turns), 1)
+        latencies = InputLatencies(capacity = 4)
+        for value in range(6):
+            latencies.record(value)
+        self.assertEqual(latencies.values("latency"), [2, 3, 4, 5])
+
     def test_countEmpty(self):
         self.x = []
         for i in range(10):
@@ -544,5 +1734,19 @@ class SnakeModelTest(unittest.TestCase):
             for j in range(10):
                 y.append(Cell)
 
+    def test_changedCells(self):
+        model = SnakeModel(10, 10, 4)
+        model.WRAP_MODE = True
+        for step in range(50):
+            before = [[cell.cell_state for cell in row] for row in model.cell_list]
+            if model.next_step() >= StepOutcome.DIED_WALL:
+                break
+            cell_list = model.cell_list
+            changed = set(divmod(cell_id, 10) for cell_id in model.changed_cells)
+            for row in range(10):
+                for col in range(10):
+                    if cell_list[row][col].cell_state != before[row][col]:
+                        self.assertIn((row, col), changed)
+
 if __name__ == "__main__":
-   snake_game = Snake()
\ No newline at end of file
+   main()
\ No newline at end of file
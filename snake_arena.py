@@ -0,0 +1,532 @@
+"""
+
+Shared arenas: many snakes, each steered by a client or a bot, on one big board served over TCP.
+
+Arena extends SnakeModel's rules to several snakes and several food items. A snake dies when it runs
+into a wall (unless wrap mode is on), into any snake's body or head, or head-on into another snake
+that moves into the same cell, and is put back at a random empty cell on the next tick. Collisions
+are judged on the board as it was before the tick, like SnakeModel does for a single snake.
+
+ArenaServer ticks the arena with asyncio at a fixed rate and broadcasts only the cells that changed.
+Every client gets the same delta frame, encoded once per tick. Writes never wait: a client whose
+outbound buffer grows past max_buffer is dropped instead of stalling the tick.
+
+Frames from the server, little endian: uint32 length of the rest, uint8 kind, then
+    HELLO   rows, cols, snake id (uint32 each), tick (uint64), zlib compressed board
+    DELTA   tick (uint64), count (uint32), count uint32 values cell id << 2 | CellState
+    DEATH   tick (uint64), points (uint32), sent to the client whose snake died
+Clients send one byte per turn, an index into DIRECTIONS.
+
+    python snake_arena.py --bots 200 --rows 500 --cols 500 --ticks 300
+
+runs a server and a bot load generator in a second process and prints the tick times.
+
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import struct
+import time
+import unittest
+import zlib
+from array import array
+from collections import deque
+
+from snake7 import SnakeModel, CellState, StepTimings, TurnQueue
+
+DIRECTIONS = "NESW"
+FRAME = struct.Struct("<IB")
+HELLO, DELTA, DEATH = 0, 1, 2
+HELLO_HEADER = struct.Struct("<IIIQ")
+DELTA_HEADER = struct.Struct("<QI")
+DEATH_HEADER = struct.Struct("<QI")
+
+class ArenaSnake:
+    """ One snake of an arena """
+    __slots__ = ("snake_id", "body", "direction", "turns", "grow", "points", "alive")
+    def __init__(self, snake_id):
+        """ A snake that is not on the board yet """
+        self.snake_id = snake_id
+        self.body = deque()     # Cell ids, head first
+        self.direction = "N"
+        self.turns = TurnQueue()
+        self.grow = False
+        self.points = 0
+        self.alive = False
+
+class Arena(SnakeModel):
+    """
+    Several snakes and num_food food items on one board. Uses the board, the pool of empty cells and the
+    random generator of SnakeModel, but not its single snake and food.
+    changed_cells collects every changed cell until take_changes is called.
+    """
+    def __init__(self, num_cols, num_rows, seed=None, wrap_mode=True, num_food=1):
+        """ Empty arena with num_food food items, snakes join with add_snake """
+        self.num_food = num_food
+        self.snakes = {}
+        self.foods = set()
+        self.next_snake_id = 0
+        self.tick = 0
+        super().__init__(num_cols, num_rows, seed, wrap_mode)
+
+    def reset(self, seed=None):
+        """ Empty the board, take every snake off it and put down the food """
+        self.clear_board(seed)
+        self.foods.clear()
+        for snake in self.snakes.values():
+            snake.body.clear()
+            snake.alive = False
+        self.tick = 0
+        self.add_food()
+
+    def add_food(self):
+        """ Put food on random empty cells until there are num_food items or the board is full """
+        while len(self.foods) < self.num_food:
+            cell_id = self.random_empty_cell()
+            if cell_id < 0:
+                return
+            self.remove_free_cell(cell_id)
+            self.board[cell_id] = CellState.FOOD
+            self.foods.add(cell_id)
+            self.changed_cells.append(cell_id)
+
+    def add_snake(self):
+        """ A new snake at a random empty cell, returns its id """
+        snake = ArenaSnake(self.next_snake_id)
+        self.next_snake_id += 1
+        self.snakes[snake.snake_id] = snake
+        self.spawn(snake)
+        return snake.snake_id
+
+    def remove_snake(self, snake_id):
+        """ Take a snake out of the arena """
+        snake = self.snakes.pop(snake_id, None)
+        if snake is not None:
+            self.clear_snake(snake)
+
+    def spawn(self, snake):
+        """ Put a snake of length 1 at a random empty cell, it stays dead while the board is full """
+        cell_id = self.random_empty_cell()
+        if cell_id < 0:
+            return
+        self.remove_free_cell(cell_id)
+        self.board[cell_id] = CellState.SNAKE_HEAD
+        self.changed_cells.append(cell_id)
+        snake.body.append(cell_id)
+        snake.direction = DIRECTIONS[self.rng.randrange(4)]
+        snake.turns.clear()
+        snake.grow = False
+        snake.points = 0
+        snake.alive = True
+
+    def clear_snake(self, snake):
+        """ Empty the cells of a snake """
+        board = self.board
+        for cell_id in snake.body:
+            board[cell_id] = CellState.EMPTY
+            self.add_free_cell(cell_id)
+            self.changed_cells.append(cell_id)
+        snake.body.clear()
+        snake.alive = False
+
+    def turn(self, snake_id, direction):
+        """ Queue a turn of a snake, dropped when it would reverse the snake or the queue is full """
+        snake = self.snakes.get(snake_id)
+        if snake is not None:
+            snake.turns.push(direction, snake.direction)
+
+    def step(self):
+        """
+        Move every snake one cell at the same time and respawn the ones that died on the last tick.
+        Returns the (snake id, cause) of the snakes that died, cause "wall", "self", "snake" or "head-on"
+        """
+        board = self.board
+        for snake in self.snakes.values():
+            if not snake.alive:
+                self.spawn(snake)
+        moves = []
+        targets = {}
+        for snake in self.snakes.values():
+            if not snake.alive:
+                continue
+            if snake.turns:
+                snake.direction = snake.turns.pop()[0]
+            target = self.neighbour(snake.body[0], snake.direction)
+            moves.append((snake, target))
+            targets[target] = targets.get(target, 0) + 1
+        deaths = []
+        survivors = []
+        for snake, target in moves:
+            if target < 0:
+                deaths.append((snake, "wall"))
+            elif board[target] == CellState.SNAKE or board[target] == CellState.SNAKE_HEAD:
+                deaths.append((snake, "self" if target in snake.body else "snake"))
+            elif targets[target] > 1:
+                deaths.append((snake, "head-on"))
+            else:
+                survivors.append((snake, target))
+        for snake, cause in deaths:
+            self.clear_snake(snake)
+        changed = self.changed_cells
+        for snake, target in survivors:
+            body = snake.body
+            head = body[0]
+            if len(body) > 1:
+                board[head] = CellState.SNAKE
+                changed.append(head)
+            ate = board[target] == CellState.FOOD
+            board[target] = CellState.SNAKE_HEAD
+            self.remove_free_cell(target)
+            body.appendleft(target)
+            changed.append(target)
+            if snake.grow:
+                snake.grow = False
+                board[body[1]] = CellState.SNAKE
+                changed.append(body[1])
+            else:
+                tail = body.pop()
+                board[tail] = CellState.EMPTY
+                self.add_free_cell(tail)
+                changed.append(tail)
+            if ate:
+                self.foods.discard(target)
+                snake.grow = True
+                snake.points += 1
+        self.add_food()
+        self.tick += 1
+        return [(snake.snake_id, cause) for snake, cause in deaths]
+
+    def take_changes(self):
+        """ The cells changed since the last call, each once """
+        changed = list(dict.fromkeys(self.changed_cells))
+        self.changed_cells = []
+        return changed
+
+def frame(kind, body):
+    """ A frame with its length and kind in front """
+    return FRAME.pack(len(body) + 1, kind) + body
+
+def encode_hello(arena, snake_id):
+    """ HELLO frame with the whole board """
+    return frame(HELLO, HELLO_HEADER.pack(arena.num_rows, arena.num_cols, snake_id, arena.tick)
+                 + zlib.compress(bytes(arena.board), 1))
+
+def encode_delta(arena, cell_ids):
+    """ DELTA frame with the current state of the given cells """
+    board = arena.board
+    values = array('I', [cell_id << 2 | board[cell_id] for cell_id in cell_ids])
+    return frame(DELTA, DELTA_HEADER.pack(arena.tick, len(values)) + values.tobytes())
+
+def apply_delta(board, body):
+    """ Apply the body of a DELTA frame to a board bytearray, returns the tick """
+    tick, count = DELTA_HEADER.unpack_from(body)
+    values = array('I', body[DELTA_HEADER.size:DELTA_HEADER.size + 4 * count])
+    for value in values:
+        board[value >> 2] = value & 3
+    return tick
+
+class TickTimings(StepTimings):
+    """ Ring buffer with the time of every server tick, in seconds: stepping the arena and broadcasting """
+    FIELDS = ("step", "broadcast")
+    def record(self, step, broadcast):
+        """ Add one tick, overwriting the oldest one when the buffer is full """
+        index = self.count % self.capacity
+        self.columns["step"][index] = step
+        self.columns["broadcast"][index] = broadcast
+        self.count += 1
+
+class ArenaServer:
+    """ Serves an Arena over TCP, ticking every tick_millis and broadcasting delta frames """
+    def __init__(self, arena, tick_millis = 100, max_buffer = 1 << 20, send_buffer = None):
+        """
+        max_buffer is the most bytes a client may have waiting to be sent before it is dropped,
+        send_buffer sets the socket send buffer of every client connection (None keeps the default)
+        """
+        self.arena = arena
+        self.tick_millis = tick_millis
+        self.max_buffer = max_buffer
+        self.send_buffer = send_buffer
+        self.writers = {}   # snake id: StreamWriter
+        self.timings = TickTimings()
+        self.dropped = 0    # Clients dropped for being too slow
+        self.server = None
+
+    async def start(self, host = "127.0.0.1", port = 0):
+        """ Start listening, returns the port (a free one by default) """
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle_client(self, reader, writer):
+        """ One connection: a snake for it, the HELLO frame, then its turns until it hangs up """
+        if self.send_buffer is not None:
+            writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        snake_id = self.arena.add_snake()
+        self.writers[snake_id] = writer
+        self.send(snake_id, encode_hello(self.arena, snake_id))
+        try:
+            while snake_id in self.writers:
+                data = await reader.read(64)
+                if not data:
+                    break
+                for code in data:
+                    if code < 4:
+                        self.arena.turn(snake_id, DIRECTIONS[code])
+        except ConnectionError:
+            pass
+        finally:
+            self.drop(snake_id)
+
+    def send(self, snake_id, data):
+        """ Queue data for a client without waiting, or drop the client when its buffer is full """
+        writer = self.writers.get(snake_id)
+        if writer is None:
+            return
+        if writer.transport.get_write_buffer_size() + len(data) > self.max_buffer:
+            self.dropped += 1
+            self.drop(snake_id, True)
+        else:
+            writer.write(data)
+
+    def drop(self, snake_id, abort = False):
+        """ Disconnect a client and take its snake out, abort skips sending what is still buffered """
+        writer = self.writers.pop(snake_id, None)
+        if writer is None:
+            return
+        self.arena.remove_snake(snake_id)
+        if abort:
+            writer.transport.abort()
+        else:
+            writer.close()
+
+    def tick(self):
+        """ Step the arena and send the delta frame to everyone """
+        start = time.perf_counter()
+        deaths = self.arena.step()
+        stepped = time.perf_counter()
+        delta = encode_delta(self.arena, self.arena.take_changes())
+        for snake_id in list(self.writers):
+            self.send(snake_id, delta)
+        for snake_id, cause in deaths:
+            snake = self.arena.snakes.get(snake_id)
+            if snake is not None:
+                self.send(snake_id, frame(DEATH, DEATH_HEADER.pack(self.arena.tick, snake.points)))
+        self.timings.record(stepped - start, time.perf_counter() - stepped)
+
+    async def run(self, ticks = None):
+        """
+        Tick at a fixed rate, ticks times or forever. Deadlines are counted from the start so late ticks do
+        not delay the later ones, but more than one tick behind the missed ones are skipped
+        """
+        loop = asyncio.get_running_loop()
+        step_time = self.tick_millis / 1000
+        base = loop.time()
+        done = 0
+        while ticks is None or done < ticks:
+            self.tick()
+            done += 1
+            delay = base + done * step_time - loop.time()
+            if delay < -step_time:
+                base -= delay
+                delay = 0
+            await asyncio.sleep(max(0, delay))
+
+    async def close(self):
+        """ Stop listening and hang up on every client after sending what they still have buffered """
+        self.server.close()
+        for snake_id in list(self.writers):
+            self.drop(snake_id)
+        await self.server.wait_closed()
+
+class BotClient:
+    """ Load generator client: keeps its own copy of the board from the frames and turns at random """
+    def __init__(self, seed = None, turn_probability = 0.1, stall = 0.0):
+        """ The bot stops reading for stall seconds after connecting, to play a client too slow to keep up """
+        self.rng = random.Random(seed)
+        self.turn_probability = turn_probability
+        self.stall = stall
+        self.board = None
+        self.snake_id = None
+        self.tick = 0
+        self.frames = 0
+        self.bytes = 0
+        self.deaths = 0
+
+    async def run(self, host, port, receive_buffer = None):
+        """ Play until the server hangs up """
+        sock = None
+        if receive_buffer is not None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+            # Connect without blocking the loop, which may be running the server as well
+            sock.setblocking(False)
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.sock_connect(sock, (host, port))
+            except OSError:
+                sock.close()
+                raise
+            reader, writer = await asyncio.open_connection(sock = sock)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        try:
+            kind, body = await self.read_frame(reader)
+            rows, cols, self.snake_id, self.tick = HELLO_HEADER.unpack_from(body)
+            self.board = bytearray(zlib.decompress(body[HELLO_HEADER.size:]))
+            if self.stall:
+                writer.transport.pause_reading()
+                await asyncio.sleep(self.stall)
+                writer.transport.resume_reading()
+            while True:
+                kind, body = await self.read_frame(reader)
+                if kind == DELTA:
+                    self.tick = apply_delta(self.board, body)
+                    if self.rng.random() < self.turn_probability:
+                        writer.write(bytes([self.rng.randrange(4)]))
+                elif kind == DEATH:
+                    self.deaths += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_frame(self, reader):
+        """ Next (kind, body) from the server """
+        length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+        body = await reader.readexactly(length - 1)
+        self.frames += 1
+        self.bytes += FRAME.size + len(body)
+        return kind, body
+
+async def run_bots(host, port, num_bots, seed = 0):
+    """ Connect num_bots bots and play until the server hangs up, returns the bots """
+    bots = [BotClient(seed + index) for index in range(num_bots)]
+    await asyncio.gather(*(bot.run(host, port) for bot in bots))
+    return bots
+
+def bot_process(host, port, num_bots, seed):
+    """ Entry point of the load generator process """
+    asyncio.run(run_bots(host, port, num_bots, seed))
+
+async def load_test(num_bots = 200, num_rows = 500, num_cols = 500, num_food = 200, ticks = 300, tick_millis = 50,
+                    seed = 0):
+    """ Serve an arena to num_bots bots running in another process, returns the server after ticks ticks """
+    server = ArenaServer(Arena(num_cols, num_rows, seed, True, num_food), tick_millis)
+    port = await server.start()
+    # Spawned, not forked, so the bots do not inherit the running event loop
+    bots = multiprocessing.get_context("spawn").Process(target = bot_process, args = ("127.0.0.1", port, num_bots, seed))
+    bots.start()
+    while len(server.writers) < num_bots and bots.is_alive():
+        await asyncio.sleep(0.05)
+    await server.run(ticks)
+    await server.close()
+    # Joining would block the loop before the connections are closed, so wait for the bots without blocking
+    while bots.is_alive():
+        await asyncio.sleep(0.05)
+    return server
+
+def main():
+    """ Run a server, with --bots also a load generator against it, and print the tick times """
+    parser = argparse.ArgumentParser(description = "Multi-snake arena server")
+    parser.add_argument("--rows", type = int, default = 500)
+    parser.add_argument("--cols", type = int, default = 500)
+    parser.add_argument("--food", type = int, default = 200, help = "food items on the board")
+    parser.add_argument("--tick-millis", type = int, default = 50)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--port", type = int, default = 7777, help = "port to serve on without --bots")
+    parser.add_argument("--bots", type = int, default = 0, help = "bots to run against the server in another process")
+    parser.add_argument("--ticks", type = int, default = 300, help = "ticks to run with --bots")
+    args = parser.parse_args()
+    if args.bots:
+        server = asyncio.run(load_test(args.bots, args.rows, args.cols, args.food, args.ticks, args.tick_millis,
+                                       args.seed))
+        for name in TickTimings.FIELDS:
+            print("{:9s} p50/p95/p99 ms: {}".format(name, "/".join(
+                "%.2f" % (value * 1000) for value in server.timings.percentiles(name))))
+        print("{} clients dropped".format(server.dropped))
+        return
+
+    async def serve():
+        server = ArenaServer(Arena(args.cols, args.rows, args.seed, True, args.food), args.tick_millis)
+        await server.start("127.0.0.1", args.port)
+        await server.run()
+    asyncio.run(serve())
+
+class ArenaTest(unittest.TestCase):
+    """
+    For checking the arena rules and that clients see the same board as the server.
+    """
+    def lay(self, arena, cells, direction):
+        """ Add a snake on the given cells, head first """
+        snake_id = arena.add_snake()
+        snake = arena.snakes[snake_id]
+        arena.clear_snake(snake)
+        for cell_id in cells:
+            arena.board[cell_id] = CellState.SNAKE
+            arena.remove_free_cell(cell_id)
+            snake.body.append(cell_id)
+        arena.board[cells[0]] = CellState.SNAKE_HEAD
+        snake.direction = direction
+        snake.alive = True
+        return snake_id
+
+    def test_collisions(self):
+        arena = Arena(10, 10, 1, False, num_food = 0)
+        first = self.lay(arena, [12, 11], "E")
+        second = self.lay(arena, [14, 15], "W")
+        crossed = self.lay(arena, [43, 53], "N")
+        walled = self.lay(arena, [90], "S")
+        deaths = dict(arena.step())
+        self.assertEqual(deaths[first], "head-on")
+        self.assertEqual(deaths[second], "head-on")
+        self.assertEqual(deaths[walled], "wall")
+        self.assertNotIn(crossed, deaths)
+        self.assertEqual(list(arena.snakes[crossed].body), [33, 43])
+        self.assertEqual(arena.board[13], CellState.EMPTY)
+        arena.turn(crossed, "S")    # Reversing is dropped
+        arena.step()
+        self.assertEqual(arena.snakes[crossed].body[0], 23)
+
+    def test_foodAndGrowth(self):
+        arena = Arena(12, 12, 3, True, num_food = 5)
+        self.assertEqual(len(arena.foods), 5)
+        snake_id = self.lay(arena, [0], "E")
+        for food in list(arena.foods):
+            arena.board[food] = CellState.EMPTY
+            arena.add_free_cell(food)
+        arena.foods = {1}
+        arena.remove_free_cell(1)
+        arena.board[1] = CellState.FOOD
+        arena.step()
+        arena.step()
+        snake = arena.snakes[snake_id]
+        self.assertEqual(snake.points, 1)
+        self.assertEqual(list(snake.body), [2, 1])
+        self.assertEqual(len(arena.foods), 5)
+        self.assertEqual(sum(1 for state in arena.board if state == CellState.FOOD), 5)
+
+    def test_clientsSeeServerBoard(self):
+        async def play():
+            server = ArenaServer(Arena(40, 30, 2, True, 20), tick_millis = 5, max_buffer = 4096,
+                                 send_buffer = 4096)
+            port = await server.start()
+            bots = [BotClient(index, 0.3) for index in range(8)]
+            slow = BotClient(99, stall = 1.0)
+            tasks = [asyncio.ensure_future(bot.run("127.0.0.1", port)) for bot in bots]
+            tasks.append(asyncio.ensure_future(slow.run("127.0.0.1", port, receive_buffer = 2048)))
+            while len(server.writers) < len(tasks):
+                await asyncio.sleep(0.01)
+            await server.run(400)
+            board = bytes(server.arena.board)
+            await server.close()
+            await asyncio.gather(*tasks)
+            return server, bots, board
+        server, bots, board = asyncio.run(play())
+        self.assertEqual(server.dropped, 1)
+        for bot in bots:
+            self.assertEqual(bytes(bot.board), board)
+            self.assertEqual(bot.tick, 400)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""
+
+Autopilot for the snake game: picks the next direction for a SnakeModel.
+
+The autopilot searches a path to the food with A* and only takes it when the snake could still reach
+its own tail after eating. Otherwise it heads for where its tail is now, when it could reach the tail
+again from there, and looks for the food once it arrives. Paths are cached and followed one cell per
+step while the food stays put and no changed cell of the board lands on the rest of the path, so a
+search runs about once per food or per lap behind the tail instead of on every step. When neither is
+safe it picks one safe move at a time, preferring a Hamiltonian cycle of the board (when rows or
+columns are even) and then the move that leaves the most room.
+
+Nothing is built over the whole board: neighbours come from the model's move table, the cycle is
+worked out from a cell's row and column, and how soon each body cell frees up comes from the step
+at which the head entered it, updated by one entry per step. So the first decision on a huge board
+costs no more than any other.
+
+An Autopilot is a policy for snake7.run_headless, snake_replay.record_game and the Snake window.
+The function autopilot can be given to snake_tournament as snake_autopilot:autopilot.
+
+"""
+import heapq
+import tracemalloc
+import unittest
+import weakref
+from collections import deque
+
+from snake7 import SnakeModel, CellState, StepOutcome, run_headless
+
+DIRECTIONS = "NESW"
+
+class ComputedMoves:
+    """ Stands in for SnakeModel.moves on boards too big for a move table, working out each neighbour when asked """
+    __slots__ = ("model",)
+    def __init__(self, model):
+        self.model = model
+
+    def __getitem__(self, index):
+        return self.model.neighbour(index // 4, DIRECTIONS[index % 4])
+
+class Autopilot:
+    """ Chooses directions for one game. Call it with the model before every step """
+    # Every search stops after taking this many cells off its queue, so a decision costs a bounded amount of work
+    # however big the board is. A search that runs out finds no path, and a tail it cannot reach is not safe
+    PATH_LIMIT = 600
+    def __init__(self):
+        """ Nothing is known about the board until the first call """
+        self.num_rows = self.num_cols = None
+        self.wrap_mode = None
+        # stamps[cell_id] is the clock when the head moved into cell_id, so a body cell is clock - stamps[cell_id]
+        # cells behind the head. One stamp is added per step, and they are rebuilt when steps were missed
+        self.stamps = {}
+        self.clock = 0
+        self.path = deque()     # (direction, cell id) still to follow to the food
+        self.path_cells = set()
+        self.path_food = -1
+        self.expanded = 0       # Cells taken off the queues of all searches so far, the work of the decisions
+
+    def __call__(self, model):
+        """ Return the direction to take on the next step of model """
+        if (model.num_rows, model.num_cols, model.WRAP_MODE) != (self.num_rows, self.num_cols, self.wrap_mode):
+            self.new_board(model)
+        self.track_body(model)
+        head = model.snake_body[0]
+        if not self.path_still_good(model, head):
+            self.plan(model, head)
+        if self.path:
+            direction, cell_id = self.path.popleft()
+            self.path_cells.discard(cell_id)
+            return direction
+        return self.fallback(model, head)
+
+    def plan(self, model, head):
+        """
+        Find a new path: to the food when the tail can still be reached after eating, else to where the tail is
+        now, so the snake follows its own body until the food can be reached safely. Food too far away for one
+        search gets a path part of the way there, and the next search starts where it ends
+        """
+        self.path.clear()
+        self.path_cells.clear()
+        self.path_food = model.food
+        path = None
+        if model.food >= 0:
+            path = self.find_path(model, head, model.food, partial = True)
+            if path is not None and not self.tail_reachable_after(model, path, path[-1][1] == model.food):
+                path = None
+        tail = model.snake_body[-1]
+        if path is None and tail != head:
+            # Eating on the way would keep the tail in place and break the timing, so go around the food
+            path = self.find_path(model, head, tail, model.food)
+            if path is not None and not self.tail_reachable_after(model, path, False):
+                path = None
+        if path is not None:
+            self.path.extend(path)
+            self.path_cells.update(cell_id for direction, cell_id in path)
+
+    def new_board(self, model):
+        """ Forget the path and the stamps of the last board size or wrap mode """
+        self.num_rows, self.num_cols, self.wrap_mode = model.num_rows, model.num_cols, model.WRAP_MODE
+        self.stamps.clear()
+        self.path.clear()
+        self.path_cells.clear()
+
+    def track_body(self, model):
+        """
+        Stamp the cell the head moved into since the last call. When that does not account for the body (steps were 
+        missed, or a new game started) or old stamps pile up, stamp the whole body again
+        """
+        body = model.snake_body
+        stamps = self.stamps
+        head = body[0]
+        if stamps.get(head) != self.clock:
+            self.clock += 1
+            stamps[head] = self.clock
+        clock = self.clock
+        if (len(body) > 1 and stamps.get(body[1]) != clock - 1 or stamps.get(body[-1]) != clock - len(body) + 1 
+                or len(stamps) > 2 * len(body) + 64):
+            stamps.clear()
+            for index, cell_id in enumerate(body):
+                stamps[cell_id] = clock - index
+
+    def move_table(self, model):
+        """ The model's neighbour of every cell in every direction, at cell_id * 4 + direction index """
+        return model.moves if model.moves is not None else ComputedMoves(model)
+
+    def path_still_good(self, model, head):
+        """
+        The cached path can be followed when the food has not moved, the head is where the path left it
+        and none of the cells changed by the last step blocks the rest of the path
+        """
+        if not self.path or model.food != self.path_food:
+            return False
+        direction, cell_id = self.path[0]
+        if self.move_table(model)[head * 4 + SnakeModel.DIRECTION_INDEX[direction]] != cell_id:
+            return False
+        for changed in model.changed_cells:
+            if changed in self.path_cells and model.board[changed] == CellState.SNAKE:
+                return False
+        return True
+
+    def estimator(self, goal):
+        """ Function giving the number of steps from a cell to goal if nothing was in the way """
+        rows, cols = self.num_rows, self.num_cols
+        goal_y, goal_x = divmod(goal, cols)
+        wrap = self.wrap_mode
+
+        def estimate(cell_id):
+            y, x = divmod(cell_id, cols)
+            dy, dx = abs(y - goal_y), abs(x - goal_x)
+            if wrap:
+                dy, dx = min(dy, rows - dy), min(dx, cols - dx)
+            return dy + dx
+
+        return estimate
+
+    def find_path(self, model, start, goal, avoid = -1, partial = False):
+        """ 
+        A* from start to goal around the cell avoid. A cell taken by the body can be entered once that part of
+        the body has moved on. Ties between cells as close to the goal go to the one nearest to start. On big open
+        boards that expands a wide diamond of cells, so when it runs out of cells the search runs again with ties 
+        going to the cell furthest from start, which heads straight for the goal. When that runs out too, with 
+        partial the path goes to the cell it got closest to the goal, else there is none
+        """
+        # A body cell index steps behind the head frees up after length - index steps
+        length = len(model.snake_body) + (1 if model.grow_check else 0)
+        wait = length - self.clock
+        board, stamps, moves = model.board, self.stamps, self.move_table(model)
+        snake, snake_head = CellState.SNAKE, CellState.SNAKE_HEAD
+        rows, cols, wrap = self.num_rows, self.num_cols, self.wrap_mode
+        goal_y, goal_x = divmod(goal, cols)
+        estimate = self.estimator(goal)
+        for tie in (1, -1):
+            came_from = {start: None}
+            frontier = [(estimate(start), 0, 0, start)]
+            expanded = 0
+            closest, closest_estimate = start, estimate(start)
+            while frontier and expanded < self.PATH_LIMIT:
+                score, order, steps, cell_id = heapq.heappop(frontier)
+                expanded += 1
+                if cell_id == goal:
+                    self.expanded += expanded
+                    return self.path_to(came_from, cell_id)
+                if score - steps < closest_estimate:
+                    closest, closest_estimate = cell_id, score - steps
+                for index in range(4):
+                    neighbour = moves[cell_id * 4 + index]
+                    if neighbour < 0 or neighbour in came_from or neighbour == avoid:
+                        continue
+                    state = board[neighbour]
+                    if (state == snake or state == snake_head) and wait + stamps[neighbour] > steps:
+                        continue
+                    came_from[neighbour] = (DIRECTIONS[index], cell_id)
+                    # estimate(neighbour), written out as this is the innermost loop
+                    y, x = divmod(neighbour, cols)
+                    dy, dx = abs(y - goal_y), abs(x - goal_x)
+                    if wrap:
+                        dy, dx = min(dy, rows - dy), min(dx, cols - dx)
+                    heapq.heappush(frontier, (steps + 1 + dy + dx, tie * (steps + 1), steps + 1, neighbour))
+            self.expanded += expanded
+            if not frontier:
+                # Searched everything, there is no path
+                return None
+        if partial and closest != start:
+            return self.path_to(came_from, closest)
+        return None
+
+    def path_to(self, came_from, cell_id):
+        """ The (direction, cell id) steps a search took to get to cell_id """
+        path = []
+        while came_from[cell_id] is not None:
+            direction, previous = came_from[cell_id]
+            path.append((direction, cell_id))
+            cell_id = previous
+        path.reverse()
+        return path
+
+    def tail_reachable_after(self, model, path, eats = True):
+        """ After following path (and eating at its end), could the head still get to the tail? """
+        length = len(model.snake_body) + (1 if model.grow_check else 0)
+        # The snake after the path: the last length path cells, then the first keep cells of the old body
+        new_cells = [cell_id for direction, cell_id in path[-length:]]
+        keep = length - len(path)
+        tail = model.snake_body[keep - 1] if keep > 0 else new_cells[0]
+        if tail == new_cells[-1]:
+            return True
+        # Eating keeps the tail in place one more step
+        return self.tail_reachable(model, new_cells[-1], set(new_cells), keep, tail, 3 if eats else 2)
+
+    def blocked(self, model, extra, keep):
+        """
+        Function telling whether a cell is taken by a snake made of the cells in extra and the first keep cells 
+        of the body of model
+        """
+        board, stamps, clock = model.board, self.stamps, self.clock
+        snake, snake_head = CellState.SNAKE, CellState.SNAKE_HEAD
+
+        def is_blocked(cell_id):
+            if cell_id in extra:
+                return True
+            state = board[cell_id]
+            return (state == snake or state == snake_head) and clock - stamps[cell_id] < keep
+
+        return is_blocked
+
+    def tail_reachable(self, model, start, extra, keep, tail, min_distance = 2):
+        """ 
+        A* from start to the tail around a snake made of the cells in extra and the first keep cells of the body. 
+        The tail has to be at least min_distance steps away (it only moves after the head). Ties go to the cell 
+        furthest from start, only whether there is a path matters
+        """
+        board, stamps, moves = model.board, self.stamps, self.move_table(model)
+        snake, snake_head = CellState.SNAKE, CellState.SNAKE_HEAD
+        # A body cell is still there when it is less than keep cells behind the head
+        since = self.clock - keep
+        rows, cols, wrap = self.num_rows, self.num_cols, self.wrap_mode
+        goal_y, goal_x = divmod(tail, cols)
+        estimate = self.estimator(tail)
+        seen = {start}
+        frontier = [(estimate(start), 0, start)]
+        expanded = 0
+        while frontier and expanded < self.PATH_LIMIT:
+            score, steps, cell_id = heapq.heappop(frontier)
+            steps = -steps
+            expanded += 1
+            for index in range(4):
+                neighbour = moves[cell_id * 4 + index]
+                if neighbour < 0:
+                    continue
+                if neighbour == tail and steps + 1 >= min_distance:
+                    self.expanded += expanded
+                    return True
+                if neighbour in seen or neighbour in extra:
+                    continue
+                state = board[neighbour]
+                if (state == snake or state == snake_head) and stamps[neighbour] > since:
+                    continue
+                seen.add(neighbour)
+                # estimate(neighbour), written out as this is the innermost loop
+                y, x = divmod(neighbour, cols)
+                dy, dx = abs(y - goal_y), abs(x - goal_x)
+                if wrap:
+                    dy, dx = min(dy, rows - dy), min(dx, cols - dx)
+                heapq.heappush(frontier, (steps + 1 + dy + dx, -steps - 1, neighbour))
+        self.expanded += expanded
+        return False
+
+    def reachable(self, model, start, extra, keep, limit):
+        """ 
+        Breadth first search from start around a snake made of the cells in extra and the first keep cells of the 
+        body, returns the number of cells reached, at most limit 
+        """
+        moves = self.move_table(model)
+        is_blocked = self.blocked(model, extra, keep)
+        seen = {start}
+        queue = deque([start])
+        while queue and len(seen) < limit:
+            cell_id = queue.popleft()
+            self.expanded += 1
+            for index in range(4):
+                neighbour = moves[cell_id * 4 + index]
+                if neighbour >= 0 and neighbour not in seen and not is_blocked(neighbour):
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        return len(seen)
+
+    def fallback(self, model, head):
+        """
+        No safe path to the food or the tail: take a move after which the head can still reach the tail,
+        preferring the Hamiltonian cycle and then the move that leaves the most room
+        """
+        board, moves = model.board, self.move_table(model)
+        length = len(model.snake_body) + (1 if model.grow_check else 0)
+        next_on_cycle = hamiltonian_next(model.num_rows, model.num_cols, head)
+        # After the move the snake is the new head and the first length - 1 cells of the body
+        tail = model.snake_body[length - 2] if length > 1 else -1
+        best, best_key = None, None
+        for index in range(4):
+            neighbour = moves[head * 4 + index]
+            if neighbour < 0 or board[neighbour] == CellState.SNAKE:
+                continue
+            extra = {neighbour}
+            min_distance = 3 if neighbour == model.food else 2
+            safe = length == 1 or self.tail_reachable(model, neighbour, extra, length - 1, tail, min_distance)
+            room = self.reachable(model, neighbour, extra, length - 1, 2 * length + 2)
+            key = (safe, neighbour == next_on_cycle, room)
+            if best_key is None or key > best_key:
+                best, best_key = DIRECTIONS[index], key
+        return best
+
+def hamiltonian_next(num_rows, num_cols, cell_id):
+    """
+    Cell after cell_id on a cycle through the whole board without wrapping, worked out from its row and column,
+    or -1 when there is no cycle (both sides odd). Snakes along the rows from column 1 on and comes back up column 0.
+    """
+    if num_rows % 2 and num_cols % 2 or min(num_rows, num_cols) < 2:
+        return -1
+    y, x = divmod(cell_id, num_cols)
+    if num_rows % 2:
+        # Follow the cycle of the transposed board, which has an even number of rows
+        next_x, next_y = divmod(hamiltonian_next(num_cols, num_rows, x * num_rows + y), num_rows)
+        return next_y * num_cols + next_x
+    if x == 0:
+        # Up column 0, then back to the start of the first row
+        return cell_id - num_cols if y > 0 else 1
+    if y % 2 == 0:
+        return cell_id + 1 if x < num_cols - 1 else cell_id + num_cols
+    if x > 1:
+        return cell_id - 1
+    # The end of the last row turns into column 0
+    return cell_id + num_cols if y < num_rows - 1 else cell_id - 1
+
+_autopilots = weakref.WeakKeyDictionary()
+
+def autopilot(model):
+    """ Policy function with one Autopilot per model, for snake_tournament """
+    if model not in _autopilots:
+        _autopilots[model] = Autopilot()
+    return _autopilots[model](model)
+
+class AutopilotTest(unittest.TestCase):
+    """
+    For checking that the autopilot plays safely and fast enough.
+    """
+    def test_hamiltonianCycle(self):
+        for rows, cols in ((4, 6), (5, 6), (6, 5), (2, 2), (2, 3)):
+            cell_id, seen = 0, set()
+            for step in range(rows * cols):
+                seen.add(cell_id)
+                following = hamiltonian_next(rows, cols, cell_id)
+                y, x = divmod(cell_id, cols)
+                next_y, next_x = divmod(following, cols)
+                self.assertEqual(abs(y - next_y) + abs(x - next_x), 1)
+                cell_id = following
+            self.assertEqual(cell_id, 0)
+            self.assertEqual(len(seen), rows * cols)
+        self.assertEqual(hamiltonian_next(5, 5, 0), -1)
+
+    def test_eatsAndSurvives(self):
+        for seed in range(5):
+            result = run_headless(seed, 10, 10, False, Autopilot(), 3000)
+            self.assertGreater(result["points"], 20)
+
+    def test_bigBoardFirstCall(self):
+        # Nothing is built over the 4 million cells, so the first decision costs as much as any other
+        model = SnakeModel(2000, 2000, 1)
+        pilot = Autopilot()
+        tracemalloc.start()
+        try:
+            direction = pilot(model)
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertIn(direction, DIRECTIONS)
+        self.assertLess(peak, 1 << 20)
+        self.assertLessEqual(pilot.expanded, 9 * Autopilot.PATH_LIMIT + 3 * 4)
+        # The food is further away than one search reaches, so the path goes part of the way
+        self.assertTrue(pilot.path)
+        self.assertNotEqual(pilot.path[-1][1], model.food)
+
+    def test_decisionWork(self):
+        # A decision runs at most two path searches of two passes and two tail searches, then the fallback with a
+        # tail search and a room search of up to 2 * length + 2 cells per move, whatever the size of the board
+        for size, steps in ((30, 2000), (200, 1500)):
+            model = SnakeModel(size, size, 1)
+            pilot = Autopilot()
+            for step in range(steps):
+                before = pilot.expanded
+                direction = pilot(model)
+                length = len(model.snake_body) + 1
+                self.assertLessEqual(pilot.expanded - before, 9 * Autopilot.PATH_LIMIT + 3 * (2 * length + 2))
+                if direction is not None:
+                    model.change_direction(direction)
+                if model.next_step() >= StepOutcome.DIED_WALL:
+                    break
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""
+
+Steps many snake games at once with NumPy, for training and evaluating autopilot policies.
+
+All N boards live in one (N, rows, cols) array and every snake body lives in a ring buffer of cell ids,
+so one call to step moves every game with a handful of array operations. The rules are the ones of
+snake7.SnakeModel.move2 and check_events, including WRAP_MODE. Finished games are reset on the spot.
+
+"""
+import argparse
+import multiprocessing
+import time
+import unittest
+
+import numpy as np
+
+from snake7 import SnakeModel, CellState, StepOutcome
+
+# Directions are given as indices into DIRECTIONS, -1 keeps the current direction
+DIRECTIONS = "NESW"
+DY = np.array([-1, 0, 1, 0])
+DX = np.array([0, 1, 0, -1])
+
+class SnakeBatch:
+    """ N snake games on boards of the same size, stepped in lockstep """
+    def __init__(self, num_games, num_cols, num_rows, seed=None, wrap_mode=False):
+        """ Initialize num_games games, each with a random start and food like SnakeModel """
+        self.num_games = num_games
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.WRAP_MODE = wrap_mode
+        self.rng = np.random.default_rng(seed)
+        self.games = np.arange(num_games)
+        self.boards = np.zeros((num_games, num_rows, num_cols), dtype = np.uint8)
+        # Flat view of the boards, cell id y * num_cols + x like SnakeModel.board
+        self.flat = self.boards.reshape(num_games, num_rows * num_cols)
+        # Ring buffer of cell ids per game, the head is at head_index and the body follows it
+        self.body = np.zeros((num_games, num_rows * num_cols), dtype = np.int32)
+        self.head_index = np.zeros(num_games, dtype = np.int64)
+        self.length = np.zeros(num_games, dtype = np.int64)
+        self.direction = np.zeros(num_games, dtype = np.int64)
+        self.food = np.full(num_games, -1, dtype = np.int64)
+        self.grow_check = np.zeros(num_games, dtype = bool)
+        self.current_points = np.zeros(num_games, dtype = np.int64)
+        self.steps = np.zeros(num_games, dtype = np.int64)
+        # Score and length of the games that finished, filled in by step
+        self.finished = []
+        for game in range(num_games):
+            self.reset_game(game)
+
+    def reset_game(self, game):
+        """ Start game over like a new SnakeModel: random head, direction away from the nearest walls, random food """
+        self.flat[game] = CellState.EMPTY
+        snake_y = int(self.rng.integers(self.num_rows))
+        snake_x = int(self.rng.integers(self.num_cols))
+        start = snake_y * self.num_cols + snake_x
+        self.flat[game, start] = CellState.SNAKE_HEAD
+        self.body[game, 0] = start
+        self.head_index[game] = 0
+        self.length[game] = 1
+        top,left = snake_y,snake_x
+        bott,right = self.num_rows - snake_y, self.num_cols - snake_x
+        var = {top:"N",bott:"S",left:"W",right:"E"}
+        self.direction[game] = DIRECTIONS.index(var.get(max(var)))
+        self.grow_check[game] = False
+        self.current_points[game] = 0
+        self.steps[game] = 0
+        self.random_food(game)
+
+    def random_food(self, game):
+        """ Put the food of game on a random empty cell, or -1 when the board is full """
+        board = self.flat[game]
+        # Guess a few times, that almost always works unless the board is nearly full
+        for attempt in range(8):
+            cell_id = int(self.rng.integers(board.size))
+            if board[cell_id] == CellState.EMPTY:
+                break
+        else:
+            empty = np.flatnonzero(board == CellState.EMPTY)
+            if empty.size == 0:
+                self.food[game] = -1
+                return
+            cell_id = int(empty[self.rng.integers(empty.size)])
+        board[cell_id] = CellState.FOOD
+        self.food[game] = cell_id
+
+    def load_model(self, game, model):
+        """ Copy the state of a SnakeModel into game, so both can be stepped side by side """
+        self.flat[game] = np.frombuffer(model.board, dtype = np.uint8)
+        self.length[game] = len(model.snake_body)
+        self.head_index[game] = 0
+        self.body[game, :len(model.snake_body)] = list(model.snake_body)
+        self.direction[game] = DIRECTIONS.index(model.next_direction)
+        self.food[game] = model.food
+        self.grow_check[game] = model.grow_check
+        self.current_points[game] = model.current_points
+
+    def step(self, actions = None):
+        """
+        Move every game one step. actions holds one index into DIRECTIONS per game, or -1 to keep going straight.
+        Returns two boolean arrays: the games that ate and the games that died. Games that died are reset.
+        """
+        games = self.games
+        flat = self.flat
+        capacity = flat.shape[1]
+        if actions is not None:
+            actions = np.asarray(actions)
+            self.direction = np.where(actions >= 0, actions, self.direction)
+        head = self.body[games, self.head_index]
+        # The old head becomes body, unless the snake is only its head
+        longer = self.length > 1
+        flat[games[longer], head[longer]] = CellState.SNAKE
+        snake_y = head // self.num_cols + DY[self.direction]
+        snake_x = head % self.num_cols + DX[self.direction]
+        outside = (snake_y < 0) | (snake_y >= self.num_rows) | (snake_x < 0) | (snake_x >= self.num_cols)
+        snake_y %= self.num_rows
+        snake_x %= self.num_cols
+        new_head = snake_y * self.num_cols + snake_x
+        died = flat[games, new_head] == CellState.SNAKE
+        if not self.WRAP_MODE:
+            died |= outside
+        alive = games[~died]
+        new_head = new_head[alive]
+        flat[alive, new_head] = CellState.SNAKE_HEAD
+        self.head_index[alive] = (self.head_index[alive] - 1) % capacity
+        self.body[alive, self.head_index[alive]] = new_head
+        # Snakes that ate last step keep their tail, the others move it
+        growing = self.grow_check[alive]
+        moving = alive[~growing]
+        tail = self.body[moving, (self.head_index[moving] + self.length[moving]) % capacity]
+        flat[moving, tail] = CellState.EMPTY
+        grown = alive[growing]
+        self.length[grown] += 1
+        flat[grown, self.body[grown, (self.head_index[grown] + 1) % capacity]] = CellState.SNAKE
+        self.grow_check[:] = False
+        self.steps[alive] += 1
+        ate = np.zeros(self.num_games, dtype = bool)
+        ate[alive] = new_head == self.food[alive]
+        self.grow_check[ate] = True
+        self.current_points[ate] += 1
+        for game in np.flatnonzero(ate):
+            self.random_food(game)
+        for game in np.flatnonzero(died):
+            self.finished.append((int(self.current_points[game]), int(self.length[game]), int(self.steps[game])))
+            self.reset_game(game)
+        return ate, died
+
+def run_batch(num_games = 1024, num_rows = 30, num_cols = 30, wrap_mode = False, steps = 1000, seed = None):
+    """ Step num_games random-policy games steps times and return the game-steps per second """
+    batch = SnakeBatch(num_games, num_cols, num_rows, seed, wrap_mode)
+    rng = np.random.default_rng(seed)
+    # Keep going straight most of the time so games last more than a few steps
+    actions = np.where(rng.random((steps, num_games)) < 0.1, rng.integers(4, size = (steps, num_games)), -1)
+    start = time.perf_counter()
+    for step in range(steps):
+        batch.step(actions[step])
+    seconds = time.perf_counter() - start
+    return num_games * steps / seconds
+
+def run_batch_worker(args):
+    """ run_batch for one process of a pool """
+    return run_batch(*args)
+
+def main():
+    """ Print the game-steps per second of a batch with a random policy, one batch per worker process """
+    parser = argparse.ArgumentParser(description = "Step many snake games at once")
+    parser.add_argument("--games", type = int, default = 1024)
+    parser.add_argument("--rows", type = int, default = 30)
+    parser.add_argument("--cols", type = int, default = 30)
+    parser.add_argument("--steps", type = int, default = 1000)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--wrap", action = "store_true")
+    parser.add_argument("--workers", type = int, default = 1, help = "processes, each stepping its own batch")
+    args = parser.parse_args()
+    jobs = [(args.games, args.rows, args.cols, args.wrap, args.steps, args.seed + worker) 
+            for worker in range(args.workers)]
+    with multiprocessing.Pool(args.workers) as pool:
+        rate = sum(pool.map(run_batch_worker, jobs))
+    print("{:.0f} game-steps/sec with {} workers".format(rate, args.workers))
+
+class SnakeBatchTest(unittest.TestCase):
+    """
+    For checking that SnakeBatch plays by the rules of SnakeModel.
+    """
+    def test_matchesModel(self):
+        for wrap_mode in (False, True):
+            for seed in range(20):
+                model = SnakeModel(9, 7, seed, wrap_mode)
+                batch = SnakeBatch(1, 9, 7, seed, wrap_mode)
+                batch.load_model(0, model)
+                rng = np.random.default_rng(seed)
+                for step in range(300):
+                    action = int(rng.integers(4)) if rng.random() < 0.3 else -1
+                    if action >= 0:
+                        model.change_direction(DIRECTIONS[action])
+                    if model.next_step() >= StepOutcome.DIED_WALL:
+                        ate, died = batch.step([action])
+                        self.assertTrue(died[0])
+                        break
+                    ate, died = batch.step([action])
+                    self.assertFalse(died[0])
+                    if ate[0]:
+                        # Food is placed by each engine's own generator, use the model's
+                        batch.flat[0, batch.food[0]] = CellState.EMPTY
+                        batch.food[0] = model.food
+                        if model.food >= 0:
+                            batch.flat[0, model.food] = CellState.FOOD
+                    self.assertEqual(bytes(model.board), batch.flat[0].tobytes())
+                    self.assertEqual(model.current_points, batch.current_points[0])
+
+    def test_resetsFinishedGames(self):
+        batch = SnakeBatch(64, 10, 10, 1)
+        for step in range(50):
+            batch.step()
+        self.assertTrue(batch.finished)
+        self.assertTrue((batch.length >= 1).all())
+        self.assertTrue(((batch.boards == CellState.SNAKE_HEAD).sum(axis = (1, 2)) == 1).all())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+
+Benchmarks for the snake game, so performance work on snake7 can be measured rather than guessed.
+
+Covers SnakeModel.next_step on boards from 30x30 to 1000x1000, eating and food placement on nearly
+full boards, stepping a long snake, SnakeModel construction, cloning and snapshots and, when a display is available (a
+virtual one such as Xvfb is fine), building a SnakeView, repainting through Snake.one_step and
+resetting a game in place. Every benchmark uses a fixed seed. Results are written as JSON, and
+--compare checks them against a stored baseline and fails when a benchmark got slower by more than
+the threshold.
+
+    python snake_bench.py --output baseline.json
+    python snake_bench.py --compare baseline.json --threshold 0.2
+
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import snake7
+from snake7 import SnakeModel, CellState, StepOutcome
+
+SEED = 1234
+BENCHMARKS = []
+
+def benchmark(name):
+    """ Register a benchmark. It is called with the repeat count and returns (operations, seconds) """
+    def register(function):
+        BENCHMARKS.append((name, function))
+        return function
+    return register
+
+def serpentine(model, length):
+    """ Lay a snake of length cells along the rows of model, boustrophedon style, and return the direction
+    table that keeps it on a Hamiltonian cycle of the board """
+    from snake_autopilot import hamiltonian_next, DIRECTIONS
+    rows, cols = model.num_rows, model.num_cols
+    order = [0]
+    while len(order) < length:
+        order.append(hamiltonian_next(rows, cols, order[-1]))
+    model.board[:] = bytes(len(model.board))
+    model.snake_body.clear()
+    for cell_id in reversed(order):
+        model.snake_body.append(cell_id)
+        model.board[cell_id] = CellState.SNAKE
+    model.board[order[-1]] = CellState.SNAKE_HEAD
+    model.grow_check = False
+    model.empty_Cells()
+    model.food = -1
+    model.random_food()
+    directions = []
+    for cell_id in range(rows * cols):
+        following = hamiltonian_next(rows, cols, cell_id)
+        for direction in DIRECTIONS:
+            if model.neighbour(cell_id, direction) == following:
+                directions.append(direction)
+                break
+    return directions
+
+def step_board(size, steps):
+    """ next_step on an open size x size board with wraparound, a new game whenever the snake dies """
+    model = SnakeModel(size, size, SEED, True)
+    done = 0
+    start = time.perf_counter()
+    while done < steps:
+        if model.next_step() >= StepOutcome.DIED_WALL:
+            model = SnakeModel(size, size, SEED + done, True)
+        done += 1
+    return steps, time.perf_counter() - start
+
+for size, steps in ((30, 200000), (100, 200000), (300, 100000), (1000, 50000)):
+    benchmark("next_step_{0}x{0}".format(size))(
+        lambda repeat, size = size, steps = steps: step_board(size, steps * repeat))
+
+@benchmark("eat_nearly_full_100x100")
+def eat_nearly_full(repeat):
+    """ eat (random_food included) when only 1% of a 100x100 board is empty """
+    model = SnakeModel(100, 100, SEED)
+    serpentine(model, 100 * 100 * 99 // 100)
+    eats = 20000 * repeat
+    start = time.perf_counter()
+    for count in range(eats):
+        food = model.food
+        model.eat()
+        # Give the old food cell back so the board stays equally full
+        model.board[food] = CellState.EMPTY
+        model.add_free_cell(food)
+    return eats, time.perf_counter() - start
+
+@benchmark("long_snake_200x200")
+def long_snake(repeat):
+    """ next_step of a snake filling half of a 200x200 board, self-collision checked on every step """
+    model = SnakeModel(200, 200, SEED)
+    directions = serpentine(model, 200 * 200 // 2)
+    steps = 100000 * repeat
+    start = time.perf_counter()
+    for count in range(steps):
+        model.next_direction = directions[model.snake_body[0]]
+        model.next_step()
+    return steps, time.perf_counter() - start
+
+for size, count in ((30, 2000), (300, 20), (1000, 3)):
+    @benchmark("model_init_{0}x{0}".format(size))
+    def model_init(repeat, size = size, count = count):
+        """ SnakeModel construction """
+        start = time.perf_counter()
+        for seed in range(count * repeat):
+            SnakeModel(size, size, seed)
+        return count * repeat, time.perf_counter() - start
+
+for size in (30, 100):
+    @benchmark("clone_{0}x{0}".format(size))
+    def clone(repeat, size = size):
+        """ SnakeModel.clone of a game where the snake fills a quarter of the board, kept 100 at a time """
+        model = SnakeModel(size, size, SEED)
+        serpentine(model, size * size // 4)
+        batches = 100 * repeat
+        start = time.perf_counter()
+        for batch in range(batches):
+            clones = [model.clone() for count in range(100)]
+        return batches * 100, time.perf_counter() - start
+
+    @benchmark("snapshot_restore_{0}x{0}".format(size))
+    def snapshot_restore(repeat, size = size):
+        """ SnakeModel.snapshot and restore of a game where the snake fills a quarter of the board """
+        model = SnakeModel(size, size, SEED)
+        serpentine(model, size * size // 4)
+        scratch = model.clone()
+        count = 10000 * repeat
+        start = time.perf_counter()
+        for index in range(count):
+            scratch.restore(model.snapshot())
+        return count, time.perf_counter() - start
+
+def display_available():
+    """ True when tkinter can open a window here """
+    if snake7.tk is None:
+        return False
+    try:
+        snake7.tk.Tk().destroy()
+    except snake7.tk.TclError:
+        return False
+    return True
+
+@benchmark("view_init_30x30")
+def view_init(repeat):
+    """ SnakeView construction, one tk.Frame per cell """
+    count = 3 * repeat
+    start = time.perf_counter()
+    for index in range(count):
+        view = snake7.SnakeView(30, 30)
+        view.window.update()
+        view.window.destroy()
+    return count, time.perf_counter() - start
+
+@benchmark("canvas_view_init_500x500")
+def canvas_view_init(repeat):
+    """ SnakeCanvasView construction on a big board """
+    count = 3 * repeat
+    start = time.perf_counter()
+    for index in range(count):
+        view = snake7.SnakeCanvasView(500, 500)
+        view.window.update()
+        view.window.destroy()
+    return count, time.perf_counter() - start
+
+@benchmark("one_step_repaint_30x30")
+def one_step_repaint(repeat):
+    """ Snake.one_step, model step plus repaint of the changed cells, flushed to the screen """
+    game = snake7.Snake(30, 30, run = False)
+    game.Model = SnakeModel(30, 30, SEED, True)
+    game.repaint_board()
+    game.is_running = True
+    steps = 500 * repeat
+    start = time.perf_counter()
+    for count in range(steps):
+        game.one_step()
+        if not game.is_running:
+            game.Model = SnakeModel(30, 30, SEED + count, True)
+            game.repaint_board()
+            game.is_running = True
+        game.view.window.update_idletasks()
+    seconds = time.perf_counter() - start
+    game.view.window.destroy()
+    return steps, seconds
+
+@benchmark("reset_30x30")
+def reset(repeat):
+    """ Snake.reset_handler, new game in the same window, flushed to the screen """
+    game = snake7.Snake(30, 30, run = False)
+    resets = 200 * repeat
+    start = time.perf_counter()
+    for count in range(resets):
+        game.reset_handler()
+        game.view.window.update_idletasks()
+    seconds = time.perf_counter() - start
+    game.view.window.destroy()
+    return resets, seconds
+
+TK_BENCHMARKS = ("view_init_30x30", "canvas_view_init_500x500", "one_step_repaint_30x30", "reset_30x30")
+
+def run_benchmarks(names = None, repeat = 1, rounds = 3):
+    """ Run the benchmarks (all by default) rounds times each, returns {name: result} with the best round """
+    results = {}
+    tk_ok = None
+    for name, function in BENCHMARKS:
+        if names and not any(part in name for part in names):
+            continue
+        if name in TK_BENCHMARKS:
+            if tk_ok is None:
+                tk_ok = display_available()
+            if not tk_ok:
+                results[name] = {"skipped": "no display"}
+                continue
+        best = None
+        for round_number in range(rounds):
+            operations, seconds = function(repeat)
+            if best is None or seconds / operations < best[1] / best[0]:
+                best = (operations, seconds)
+        operations, seconds = best
+        results[name] = {"ops_per_sec": operations / seconds, "us_per_op": seconds / operations * 1e6}
+    return results
+
+def compare(results, baseline, threshold):
+    """ Names of the benchmarks that are more than threshold (0.2 = 20%) slower than in baseline """
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name, {})
+        if "ops_per_sec" in result and "ops_per_sec" in old:
+            if result["ops_per_sec"] < old["ops_per_sec"] * (1 - threshold):
+                regressions.append(name)
+    return regressions
+
+def main():
+    """ Run the benchmarks, print them, optionally save them as JSON and compare them with a baseline """
+    parser = argparse.ArgumentParser(description = "Benchmarks for the snake game")
+    parser.add_argument("names", nargs = "*", help = "only run benchmarks whose name contains one of these")
+    parser.add_argument("--output", help = "write the results to this JSON file")
+    parser.add_argument("--compare", help = "baseline JSON file to check the results against")
+    parser.add_argument("--threshold", type = float, default = 0.2, help = "slowdown that counts as a regression")
+    parser.add_argument("--repeat", type = int, default = 1, help = "multiply the work of every benchmark")
+    parser.add_argument("--rounds", type = int, default = 3, help = "rounds per benchmark, the best one counts")
+    args = parser.parse_args()
+    results = run_benchmarks(args.names, args.repeat, args.rounds)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    for name, result in results.items():
+        if "skipped" in result:
+            print("{:28s} skipped, {}".format(name, result["skipped"]))
+            continue
+        line = "{:28s} {:14.1f} ops/sec {:12.3f} us/op".format(name, result["ops_per_sec"], result["us_per_op"])
+        if "ops_per_sec" in baseline.get(name, {}):
+            change = result["ops_per_sec"] / baseline[name]["ops_per_sec"] - 1
+            line += "  {:+6.1%}{}".format(change, "  REGRESSION" if name in regressions else "")
+        print(line)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"python": sys.version, "platform": platform.platform(), "seed": SEED,
+                       "results": results}, output_file, indent = 2)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
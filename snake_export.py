@@ -0,0 +1,477 @@
+"""
+
+Exports snake games as images and video without a window, for reviewing bot games.
+
+A FrameRenderer rasterises the board into one pixel buffer that is allocated once, in the colours of
+SnakeCanvasView (White empty, Blue snake, Black head, Red food, Black cell borders) at any cell size.
+After the first frame only the cells whose state changed are drawn again, the rest of the buffer is
+reused as it is. Frames are streamed into a writer as they are made, so exporting a game of any
+length keeps one frame in memory:
+
+    PPMWriter       one binary PPM file per frame, frames/frame%06d.ppm
+    GIFWriter       animated GIF, pure Python LZW. After the first frame every frame only covers the
+                    rectangle around the cells that changed, with the cells that did not change in it
+                    left transparent, so most of it compresses to almost nothing
+    VideoWriter     raw RGB frames piped into ffmpeg (or another command), for .mp4, .webm, .mkv ...
+
+    python snake_export.py game.snkr game.gif --cell-size 4 --fps 20
+
+"""
+import argparse
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from snake7 import SnakeModel, CellState, StepOutcome
+from snake_replay import Recorder, Replay
+
+# The colours of SnakeCanvasView.make_empty, make_snake, make_head and make_food, and of its borders
+RGB = {CellState.EMPTY: b"\xff\xff\xff", CellState.SNAKE: b"\x00\x00\xff",
+       CellState.SNAKE_HEAD: b"\x00\x00\x00", CellState.FOOD: b"\xff\x00\x00"}
+RGB_BORDER = b"\x00\x00\x00"
+
+class FrameRenderer:
+    """ Draws board states into one preallocated buffer of width * height pixels, row by row """
+    def __init__(self, num_rows, num_cols, cell_size = 4, colors = None, border = None):
+        """
+        colors maps every CellState to the bytes of one pixel and border is the pixel of the cell borders,
+        RGB colours by default. Cells of 4 pixels and more get a one pixel border like in SnakeCanvasView
+        """
+        colors = colors or RGB
+        border = border or RGB_BORDER
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.cell_size = cell_size
+        self.inset = 1 if cell_size >= 4 else 0
+        self.width = num_cols * cell_size + self.inset
+        self.height = num_rows * cell_size + self.inset
+        self.pixel_size = len(border)
+        self.row_bytes = self.width * self.pixel_size
+        self.pixels = bytearray(colors[CellState.EMPTY]) * (self.width * self.height)
+        if self.inset:
+            line = border * self.width
+            for r in range(num_rows + 1):
+                start = r * cell_size * self.row_bytes
+                self.pixels[start:start + self.row_bytes] = line
+            for y in range(self.height):
+                for c in range(num_cols + 1):
+                    start = y * self.row_bytes + c * cell_size * self.pixel_size
+                    self.pixels[start:start + self.pixel_size] = border
+        # One pixel row of the inside of a cell, per state
+        self.spans = {state: color * (cell_size - self.inset) for state, color in colors.items()}
+        self.shown = bytearray(num_rows * num_cols)     # State every cell is drawn in
+        self.drawn = []     # Ids of the cells the last draw changed
+
+    def origin(self, cell_id):
+        """ Pixel x and y of the top left of the inside of a cell """
+        row, col = divmod(cell_id, self.num_cols)
+        return col * self.cell_size + self.inset, row * self.cell_size + self.inset
+
+    def draw(self, board, cell_ids):
+        """
+        Bring the given cells of the buffer up to date with board, a SnakeModel.board. Cells already shown in their
+        state are skipped, so ids may repeat and cells that changed back and forth between two frames cost nothing
+        """
+        pixels, spans, shown = self.pixels, self.spans, self.shown
+        row_bytes = self.row_bytes
+        span_bytes = (self.cell_size - self.inset) * self.pixel_size
+        self.drawn = []
+        for cell_id in cell_ids:
+            state = board[cell_id]
+            if shown[cell_id] == state:
+                continue
+            shown[cell_id] = state
+            self.drawn.append(cell_id)
+            x, y = self.origin(cell_id)
+            start = y * row_bytes + x * self.pixel_size
+            span = spans[state]
+            for line in range(self.cell_size - self.inset):
+                pixels[start:start + span_bytes] = span
+                start += row_bytes
+
+    def sync(self, board):
+        """ Bring the whole buffer up to date with board, for the first frame """
+        self.draw(board, range(len(board)))
+
+    def bounds(self, cell_ids):
+        """ Pixel rectangle (x, y, width, height) around the insides of the given cells """
+        rows = [cell_id // self.num_cols for cell_id in cell_ids]
+        cols = [cell_id % self.num_cols for cell_id in cell_ids]
+        x = min(cols) * self.cell_size + self.inset
+        y = min(rows) * self.cell_size + self.inset
+        return x, y, (max(cols) + 1) * self.cell_size - x, (max(rows) + 1) * self.cell_size - y
+
+class PPMWriter:
+    """ Writes every frame into its own binary PPM file, named by pattern % frame number """
+    COLORS = RGB
+    BORDER = RGB_BORDER
+    def __init__(self, pattern, renderer):
+        """ pattern is a path with one %d, like frames/frame%06d.ppm """
+        self.pattern = pattern
+        self.renderer = renderer
+        self.header = b"P6\n%d %d\n255\n" % (renderer.width, renderer.height)
+        self.frames = 0
+        directory = os.path.dirname(pattern)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+    def write(self):
+        """ Save the renderer's current frame """
+        with open(self.pattern % self.frames, "wb") as frame_file:
+            frame_file.write(self.header)
+            frame_file.write(self.renderer.pixels)
+        self.frames += 1
+
+    def close(self):
+        """ Nothing is kept open between frames """
+        pass
+
+class VideoWriter:
+    """ Pipes raw RGB frames into an encoder, ffmpeg by default, which writes the video file """
+    COLORS = RGB
+    BORDER = RGB_BORDER
+    def __init__(self, path, renderer, fps = 10, command = None):
+        """ command is the encoder's argument list reading rgb24 frames from stdin, by default ffmpeg writing path """
+        self.renderer = renderer
+        self.frames = 0
+        if command is None:
+            if shutil.which("ffmpeg") is None:
+                raise RuntimeError("ffmpeg was not found, it is needed to write " + path)
+            # yuv420p, which players expect, needs even sizes
+            command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                       "-s", "{}x{}".format(renderer.width, renderer.height), "-r", str(fps), "-i", "-",
+                       "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path]
+        self.encoder = subprocess.Popen(command, stdin = subprocess.PIPE)
+
+    def write(self):
+        """ Send the renderer's current frame to the encoder """
+        self.encoder.stdin.write(self.renderer.pixels)
+        self.frames += 1
+
+    def close(self):
+        """ Let the encoder finish the file """
+        self.encoder.stdin.close()
+        if self.encoder.wait() != 0:
+            raise RuntimeError("The video encoder failed with exit code {}".format(self.encoder.returncode))
+
+class GIFWriter:
+    """
+    Writes an animated GIF. Pixels are indices into a palette where the index of a cell state is its value,
+    the first frame is the whole board and every later frame only the rectangle around the cells that changed
+    """
+    COLORS = {state: bytes([state]) for state in CellState}
+    BORDER = bytes([CellState.SNAKE_HEAD])
+    PALETTE = RGB[CellState.EMPTY] + RGB[CellState.SNAKE] + RGB[CellState.SNAKE_HEAD] + RGB[CellState.FOOD]
+    TRANSPARENT = 4             # Index of the pixels of a frame that keep the colour of the frame before
+    MIN_CODE_SIZE = 3           # Bits per index of the 8 colour palette
+    def __init__(self, path, renderer, fps = 10, loop = True):
+        """ Start the file, fps sets the delay of every frame (GIF counts in hundredths of seconds) """
+        self.renderer = renderer
+        self.delay = max(2, round(100 / fps))
+        self.frames = 0
+        self.file = open(path, "wb")
+        palette = self.PALETTE + bytes(8 * 3 - len(self.PALETTE))
+        self.file.write(b"GIF89a" + struct.pack("<HHBBB", renderer.width, renderer.height, 0xf2, 0, 0) + palette)
+        if loop:
+            self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def write(self):
+        """ Add the renderer's current frame """
+        renderer = self.renderer
+        if self.frames == 0:
+            rectangle = (0, 0, renderer.width, renderer.height)
+            indices = renderer.pixels
+        elif renderer.drawn:
+            rectangle = renderer.bounds(renderer.drawn)
+            indices = self.changes(rectangle)
+        else:
+            # Nothing changed, a single transparent pixel keeps the timing
+            rectangle = (0, 0, 1, 1)
+            indices = bytes([self.TRANSPARENT])
+        x, y, width, height = rectangle
+        # Graphic control: keep the frame under the next one, transparent index, delay
+        self.file.write(struct.pack("<BBBBHBB", 0x21, 0xf9, 4, 0x05, self.delay, self.TRANSPARENT, 0))
+        self.file.write(struct.pack("<BHHHHB", 0x2c, x, y, width, height, 0))
+        self.file.write(bytes([self.MIN_CODE_SIZE]))
+        data = lzw_encode(indices, self.MIN_CODE_SIZE)
+        for start in range(0, len(data), 255):
+            block = data[start:start + 255]
+            self.file.write(bytes([len(block)]) + block)
+        self.file.write(b"\x00")
+        self.frames += 1
+
+    def changes(self, rectangle):
+        """ Indices of the rectangle, transparent except for the cells drawn since the last frame """
+        renderer = self.renderer
+        x, y, width, height = rectangle
+        indices = bytearray([self.TRANSPARENT]) * (width * height)
+        pixels = renderer.pixels
+        span = renderer.cell_size - renderer.inset
+        for cell_id in renderer.drawn:
+            cell_x, cell_y = renderer.origin(cell_id)
+            source = cell_y * renderer.width + cell_x
+            target = (cell_y - y) * width + cell_x - x
+            for line in range(span):
+                indices[target:target + span] = pixels[source:source + span]
+                source += renderer.width
+                target += width
+        return indices
+
+    def close(self):
+        """ End the file """
+        self.file.write(b"\x3b")
+        self.file.close()
+
+def lzw_encode(indices, min_code_size):
+    """ GIF flavoured LZW of a sequence of palette indices, variable code sizes up to 12 bits, packed LSB first """
+    clear = 1 << min_code_size
+    code_size = min_code_size + 1
+    next_code = clear + 2
+    table = {}
+    out = bytearray()
+    bits = clear
+    bit_count = code_size
+    prefix = indices[0]
+    for index in indices[1:]:
+        key = prefix << 8 | index
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        bits |= prefix << bit_count
+        bit_count += code_size
+        while bit_count >= 8:
+            out.append(bits & 0xff)
+            bits >>= 8
+            bit_count -= 8
+        if next_code == 4096:
+            # Table full, start over
+            bits |= clear << bit_count
+            bit_count += code_size
+            table.clear()
+            code_size = min_code_size + 1
+            next_code = clear + 2
+        else:
+            table[key] = next_code
+            if next_code == 1 << code_size:
+                code_size += 1
+            next_code += 1
+        prefix = index
+    bits |= prefix << bit_count
+    bit_count += code_size
+    bits |= (clear + 1) << bit_count
+    bit_count += code_size
+    while bit_count > 0:
+        out.append(bits & 0xff)
+        bits >>= 8
+        bit_count -= 8
+    return bytes(out)
+
+WRITERS = {".gif": GIFWriter, ".mp4": VideoWriter, ".webm": VideoWriter, ".mkv": VideoWriter,
+           ".avi": VideoWriter, ".mov": VideoWriter}
+
+def open_writer(path, num_rows, num_cols, cell_size = 4, fps = 10):
+    """ Writer for path chosen by its extension, PPM frames for a pattern with %d, with a renderer of its colours """
+    if "%" in path:
+        writer_class = PPMWriter
+    else:
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in WRITERS:
+            raise ValueError("Cannot write {}: use {} or a PPM pattern with %d".format(path, ", ".join(WRITERS)))
+        writer_class = WRITERS[extension]
+    renderer = FrameRenderer(num_rows, num_cols, cell_size, writer_class.COLORS, writer_class.BORDER)
+    if writer_class is PPMWriter:
+        return PPMWriter(path, renderer)
+    return writer_class(path, renderer, fps)
+
+def export_replay(replay, writer, every = 1, stop = None):
+    """
+    Play replay back and stream a frame every every steps into writer, up to step stop (the whole game by
+    default). The last frame shows the end of the game. Returns the number of frames written, closes writer
+    """
+    model = SnakeModel(replay.num_cols, replay.num_rows, replay.seed, replay.wrap_mode)
+    renderer = writer.renderer
+    renderer.sync(model.board)
+    writer.write()
+    pending = []
+
+    def on_step(model, step):
+        pending.extend(model.changed_cells)
+        if step % every == 0:
+            renderer.draw(model.board, pending)
+            writer.write()
+            pending.clear()
+
+    stop = replay.steps if stop is None else min(stop, replay.steps)
+    replay.play_steps(model, 0, stop, on_step)
+    # Steps since the last frame
+    renderer.draw(model.board, pending)
+    if renderer.drawn:
+        writer.write()
+    writer.close()
+    return writer.frames
+
+def main():
+    """ Export a replay file as a GIF, a video or PPM frames """
+    parser = argparse.ArgumentParser(description = "Export a snake replay as images or video")
+    parser.add_argument("replay")
+    parser.add_argument("output", help = "a .gif, a video file such as .mp4 (needs ffmpeg) or frames/frame%%06d.ppm")
+    parser.add_argument("--cell-size", type = int, default = 4, help = "pixels per cell")
+    parser.add_argument("--fps", type = float, default = 10)
+    parser.add_argument("--every", type = int, default = 1, help = "write a frame every this many steps")
+    parser.add_argument("--steps", type = int, default = None, help = "stop after this many steps")
+    args = parser.parse_args()
+    replay = Replay.load(args.replay)
+    writer = open_writer(args.output, replay.num_rows, replay.num_cols, args.cell_size, args.fps)
+    start = time.perf_counter()
+    frames = export_replay(replay, writer, args.every, args.steps)
+    seconds = time.perf_counter() - start
+    print("{} frames in {:.1f} s, {:.0f} frames/sec, {:.0f}x real time at {} fps".format(
+        frames, seconds, frames / seconds, frames / args.fps / seconds, args.fps))
+
+class ExportTest(unittest.TestCase):
+    """
+    For checking that frames drawn cell by cell match frames drawn whole, and that the files decode to them.
+    """
+    def record(self, steps = 300):
+        """ A replay of a short game that turns now and then """
+        recorder = Recorder(9, 7, 4, True)
+        for step in range(steps):
+            if step % 5 == 0:
+                recorder.model.change_direction("NESW"[step // 5 % 4])
+            if recorder.next_step() >= StepOutcome.DIED_WALL:
+                break
+        return recorder, Replay(recorder.to_bytes())
+
+    def decode_gif(self, data):
+        """ Indices of the last frame of a GIF made by GIFWriter """
+        width, height = struct.unpack_from("<HH", data, 6)
+        canvas = bytearray(width * height)
+        position = 13 + 8 * 3
+        transparent = None
+        while data[position] != 0x3b:
+            if data[position] == 0x21:
+                if data[position + 1] == 0xf9:
+                    transparent = data[position + 6]
+                position += 2
+                while data[position]:
+                    position += data[position] + 1
+                position += 1
+                continue
+            x, y, frame_width, frame_height = struct.unpack_from("<HHHH", data, position + 1)
+            min_code_size = data[position + 10]
+            position += 11
+            stream = bytearray()
+            while data[position]:
+                stream += data[position + 1:position + 1 + data[position]]
+                position += data[position] + 1
+            position += 1
+            clear = 1 << min_code_size
+            bits = int.from_bytes(stream, "little")
+            table, code_size, previous, indices = None, min_code_size + 1, None, bytearray()
+            while True:
+                code = bits & ((1 << code_size) - 1)
+                bits >>= code_size
+                if code == clear:
+                    table = [bytes([index]) for index in range(clear)] + [b"", b""]
+                    code_size, previous = min_code_size + 1, None
+                    continue
+                if code == clear + 1:
+                    break
+                if code < len(table):
+                    entry = table[code]
+                    if previous is not None:
+                        table.append(previous + entry[:1])
+                else:
+                    entry = previous + previous[:1]
+                    table.append(entry)
+                indices += entry
+                previous = entry
+                if len(table) == 1 << code_size and code_size < 12:
+                    code_size += 1
+            self.assertEqual(len(indices), frame_width * frame_height)
+            for line in range(frame_height):
+                for column in range(frame_width):
+                    index = indices[line * frame_width + column]
+                    if index != transparent:
+                        canvas[(y + line) * width + x + column] = index
+        return canvas
+
+    def test_incrementalMatchesWhole(self):
+        recorder, replay = self.record()
+        for cell_size in (1, 5):
+            renderer = FrameRenderer(7, 9, cell_size)
+            model = SnakeModel(9, 7, replay.seed, replay.wrap_mode)
+            renderer.sync(model.board)
+            replay.play_steps(model, 0, replay.steps, lambda model, step: renderer.draw(model.board, model.changed_cells))
+            whole = FrameRenderer(7, 9, cell_size)
+            whole.sync(model.board)
+            self.assertEqual(renderer.pixels, whole.pixels)
+            x, y = renderer.origin(model.snake_body[0])
+            self.assertEqual(renderer.pixels[(y * renderer.width + x) * 3:][:3], RGB[CellState.SNAKE_HEAD])
+
+    def test_video(self):
+        recorder, replay = self.record()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game.rgb")
+            # A stand-in encoder that saves the raw frames it is sent
+            command = [sys.executable, "-c", "import sys; open(sys.argv[1], 'wb').write(sys.stdin.buffer.read())", path]
+            renderer = FrameRenderer(7, 9, 5)
+            frames = export_replay(replay, VideoWriter(path, renderer, command = command), every = 3)
+            with open(path, "rb") as video_file:
+                data = video_file.read()
+        frame_size = renderer.width * renderer.height * 3
+        self.assertEqual(len(data), frames * frame_size)
+        whole = FrameRenderer(7, 9, 5)
+        whole.sync(replay.play().board)
+        self.assertEqual(data[-frame_size:], whole.pixels)
+        writer = VideoWriter("failed.mp4", renderer, command = [sys.executable, "-c", "import sys; sys.exit(3)"])
+        self.assertRaises(RuntimeError, writer.close)
+
+    def test_gif(self):
+        recorder, replay = self.record()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game.gif")
+            writer = open_writer(path, 7, 9, 5)
+            frames = export_replay(replay, writer, every = 3)
+            with open(path, "rb") as gif_file:
+                data = gif_file.read()
+        self.assertGreaterEqual(frames, replay.steps // 3 + 1)
+        self.assertEqual(data[:6], b"GIF89a")
+        whole = FrameRenderer(7, 9, 5, GIFWriter.COLORS, GIFWriter.BORDER)
+        whole.sync(replay.play().board)
+        self.assertEqual(self.decode_gif(data), whole.pixels)
+
+    def test_lzwTableFull(self):
+        # Enough different strings to fill the table of 4096 codes and start over
+        rng = random.Random(1)
+        indices = bytes(rng.randrange(4) for count in range(30000)) + bytes(20000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "noise.gif")
+            renderer = FrameRenderer(100, 500, 1, GIFWriter.COLORS, GIFWriter.BORDER)
+            renderer.pixels[:] = indices
+            writer = GIFWriter(path, renderer)
+            writer.write()
+            writer.close()
+            with open(path, "rb") as gif_file:
+                self.assertEqual(self.decode_gif(gif_file.read()), indices)
+
+    def test_ppm(self):
+        recorder, replay = self.record(40)
+        with tempfile.TemporaryDirectory() as directory:
+            pattern = os.path.join(directory, "frames", "frame%04d.ppm")
+            writer = open_writer(pattern, 7, 9, 2)
+            frames = export_replay(replay, writer, every = 10)
+            self.assertEqual(len(os.listdir(os.path.dirname(pattern))), frames)
+            with open(pattern % (frames - 1), "rb") as frame_file:
+                data = frame_file.read()
+        self.assertEqual(data, b"P6\n18 14\n255\n" + writer.renderer.pixels)
+
+if __name__ == "__main__":
+    main()
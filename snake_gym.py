@@ -0,0 +1,185 @@
+"""
+
+Gym style environment over SnakeModel for training agents: reset(seed) and step(action), which returns
+(observation, reward, done, info).
+
+Observations are never built from cell_list. The "board" observation is a NumPy view of the model's
+own board bytearray, (rows, cols) of CellState values, so it costs nothing and is always current.
+The "channels" observation is a (3, rows, cols) boolean array for body, head and food that is
+allocated once and updated in place from the cells the model reports as changed. With frame_stack
+k the observation is the last k frames, oldest first: every frame is written twice into a ring of
+2k slots, so the last k frames are always one contiguous slice and the observation is a view of it.
+Observations are views, copy them to keep them past the next step.
+
+Death is reported as done with info["cause"] "wall" or "self", filling the board as done with
+info["cause"] "full", and max_steps as done with info["cause"] "max_steps".
+
+"""
+import unittest
+
+import numpy as np
+
+from snake7 import SnakeModel, CellState, StepOutcome, DEATH_CAUSES
+
+# Actions are indices into DIRECTIONS, -1 or None keeps the current direction
+DIRECTIONS = "NESW"
+REWARDS = {"food": 1.0, "step": 0.0, "death": -1.0, "full": 10.0}
+
+class SnakeEnv:
+    """ One snake game with the reset and step interface of a gym environment """
+    OBSERVATIONS = ("board", "channels")
+    def __init__(self, num_rows = 30, num_cols = 30, wrap_mode = False, observation = "board", frame_stack = 1,
+                 rewards = None, max_steps = None):
+        """
+        observation is "board" or "channels", frame_stack the number of frames in an observation,
+        rewards overrides entries of REWARDS, max_steps ends long games (None for no limit)
+        """
+        if observation not in self.OBSERVATIONS:
+            raise ValueError("observation must be one of " + ", ".join(self.OBSERVATIONS))
+        self.observation = observation
+        self.frame_stack = frame_stack
+        self.rewards = dict(REWARDS)
+        self.rewards.update(rewards or {})
+        self.max_steps = max_steps
+        self.model = SnakeModel(num_cols, num_rows, None, wrap_mode)
+        self.board = np.frombuffer(self.model.board, dtype = np.uint8).reshape(num_rows, num_cols)
+        self.channels = np.zeros((3, num_rows, num_cols), dtype = bool)
+        self.channels_flat = self.channels.reshape(3, num_rows * num_cols)
+        frame = self.board if observation == "board" else self.channels
+        # Ring of 2 * frame_stack frames, frame n is written to slots n % k and n % k + k
+        self.frames = None
+        if frame_stack > 1:
+            self.frames = np.zeros((2 * frame_stack,) + frame.shape, dtype = frame.dtype)
+        self.frame_count = 0
+        self.steps = 0
+        self.done = True
+
+    def reset(self, seed = None):
+        """ Start a new game, seeded like SnakeModel, and return the first observation """
+        self.model.reset(seed)
+        self.steps = 0
+        self.done = False
+        if self.observation == "channels":
+            board = self.board
+            np.equal(board, CellState.SNAKE, out = self.channels[0])
+            np.equal(board, CellState.SNAKE_HEAD, out = self.channels[1])
+            np.equal(board, CellState.FOOD, out = self.channels[2])
+        if self.frames is not None:
+            self.frames[:] = self.board if self.observation == "board" else self.channels
+            self.frame_count = 0
+        return self.observe()
+
+    def step(self, action):
+        """
+        Turn to DIRECTIONS[action] (-1 or None goes straight) and move one step.
+        Returns (observation, reward, done, info)
+        """
+        if self.done:
+            raise RuntimeError("The game is over, call reset")
+        model = self.model
+        if action is not None and action >= 0:
+            model.change_direction(DIRECTIONS[action])
+        rewards = self.rewards
+        reward = rewards["step"]
+        info = {}
+        self.steps += 1
+        outcome = model.next_step()
+        if outcome >= StepOutcome.DIED_WALL:
+            self.done = True
+            info["cause"] = DEATH_CAUSES[outcome]
+            reward += rewards["death"]
+        else:
+            if outcome == StepOutcome.ATE:
+                reward += rewards["food"]
+            if model.food < 0:
+                self.done = True
+                info["cause"] = "full"
+                reward += rewards["full"]
+            elif self.max_steps is not None and self.steps >= self.max_steps:
+                self.done = True
+                info["cause"] = "max_steps"
+        # On death the board is left as it was, the last frame is repeated
+        if self.observation == "channels":
+            self.update_channels(model.changed_cells)
+        if self.frames is not None:
+            self.push_frame()
+        return self.observe(), reward, self.done, info
+
+    def update_channels(self, cell_ids):
+        """ Bring the channels of the given cells up to date with the board """
+        board = self.model.board
+        body, head, food = self.channels_flat
+        for cell_id in cell_ids:
+            state = board[cell_id]
+            body[cell_id] = state == CellState.SNAKE
+            head[cell_id] = state == CellState.SNAKE_HEAD
+            food[cell_id] = state == CellState.FOOD
+
+    def push_frame(self):
+        """ Write the current frame into both of its slots of the ring """
+        self.frame_count += 1
+        slot = self.frame_count % self.frame_stack
+        frame = self.board if self.observation == "board" else self.channels
+        self.frames[slot] = frame
+        self.frames[slot + self.frame_stack] = frame
+
+    def observe(self):
+        """ The current observation, a view that the next step overwrites """
+        if self.frames is None:
+            return self.board if self.observation == "board" else self.channels
+        start = self.frame_count % self.frame_stack + 1
+        return self.frames[start:start + self.frame_stack]
+
+class SnakeEnvTest(unittest.TestCase):
+    """
+    For checking that observations are views that follow the model, and that death ends an episode.
+    """
+    def play(self, env, seed, steps = 200):
+        """ Random actions until done, yields the observation and the result of every step """
+        rng = np.random.default_rng(seed)
+        observation = env.reset(seed)
+        for step in range(steps):
+            action = int(rng.integers(4)) if rng.random() < 0.3 else -1
+            result = env.step(action)
+            yield observation, result
+            if result[2]:
+                return
+            observation = result[0]
+
+    def test_boardIsView(self):
+        env = SnakeEnv(8, 10, True)
+        observation = env.reset(2)
+        self.assertTrue(np.shares_memory(observation, np.frombuffer(env.model.board, dtype = np.uint8)))
+        for previous, (observation, reward, done, info) in self.play(env, 2):
+            self.assertEqual(observation.tobytes(), bytes(env.model.board))
+
+    def test_channels(self):
+        env = SnakeEnv(8, 10, False, "channels")
+        for previous, (observation, reward, done, info) in self.play(env, 5):
+            self.assertTrue((observation[0] == (env.board == CellState.SNAKE)).all())
+            self.assertTrue((observation[1] == (env.board == CellState.SNAKE_HEAD)).all())
+            self.assertTrue((observation[2] == (env.board == CellState.FOOD)).all())
+
+    def test_frameStack(self):
+        env = SnakeEnv(6, 6, True, "channels", frame_stack = 3, rewards = {"step": -0.01})
+        history = [env.reset(1)[-1].copy()]
+        for previous, (observation, reward, done, info) in self.play(env, 1):
+            history.append(observation[-1].copy())
+            self.assertEqual(observation.shape, (3, 3, 6, 6))
+            for age in range(1, min(3, len(history))):
+                self.assertTrue((observation[-1 - age] == history[-1 - age]).all())
+
+    def test_deathIsDone(self):
+        env = SnakeEnv(5, 5, False, rewards = {"death": -5.0})
+        env.reset(0)
+        for step in range(10):
+            observation, reward, done, info = env.step(None)
+            if done:
+                break
+        self.assertTrue(done)
+        self.assertEqual(info["cause"], "wall")
+        self.assertEqual(reward, -5.0)
+        self.assertRaises(RuntimeError, env.step, 0)
+
+if __name__ == "__main__":
+    unittest.main()
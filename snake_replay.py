@@ -0,0 +1,282 @@
+"""
+
+Records snake games into a compact replay file and plays them back without a window.
+
+A game only depends on its seed and on the player's inputs, so a replay stores the seed, the board
+size, the wrap mode and the inputs: every direction change and wraparound toggle, as the number of
+steps since the previous input and the input packed into one varint, one or two bytes per turn.
+Every checkpoint_interval steps the recorder also stores a compressed SnakeModel.snapshot, so
+seek(step) only replays the steps after the nearest checkpoint.
+
+File layout, little endian:
+    header      magic b"SNKR", version, flags (1 = wrap mode), rows, cols, seed, checkpoint interval, steps
+    inputs      varint count, then varint (steps since the previous input << 3 | input) per input
+    checkpoints varint count, then per checkpoint varint step, varint size and the zlib compressed state
+
+"""
+import argparse
+import random
+import struct
+import time
+import unittest
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+
+from snake7 import SnakeModel, StepOutcome
+
+MAGIC = b"SNKR"
+VERSION = 1
+HEADER = struct.Struct("<4sBBIIqIQ")
+# Inputs 0 to 3 are the directions, 4 and 5 turn wraparound on and off
+DIRECTIONS = "NESW"
+WRAP_ON = 4
+WRAP_OFF = 5
+# food, direction, grow_check, points, wrap mode, body length, free cells, has gauss_next, gauss_next
+STATE = struct.Struct("<qBBqBIIBd")
+RNG_STATE = struct.Struct("<625I")
+
+def write_varint(out, value):
+    """ Append value to the bytearray out, seven bits per byte """
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, position):
+    """ Read a varint from data at position, returns the value and the position after it """
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def encode_state(state):
+    """ Pack a SnakeModel.snapshot into compressed bytes. free_index is left out, decode_state rebuilds it """
+    (board, snake_body, food, direction, grow_check, points, wrap_mode,
+     free_cells, free_index, rng_state) = state
+    rng_version, rng_internal, gauss_next = rng_state
+    data = STATE.pack(food, DIRECTIONS.index(direction), grow_check, points, wrap_mode, len(snake_body),
+                      len(free_cells), gauss_next is not None, gauss_next or 0.0)
+    data += board + array('i', snake_body).tobytes() + free_cells.tobytes() + RNG_STATE.pack(*rng_internal)
+    return zlib.compress(data)
+
+def decode_state(data, num_cells):
+    """ Unpack bytes made by encode_state into a state for SnakeModel.restore """
+    data = zlib.decompress(data)
+    (food, direction, grow_check, points, wrap_mode, body_length, free_length,
+     has_gauss, gauss_next) = STATE.unpack_from(data)
+    position = STATE.size
+    board = data[position:position + num_cells]
+    position += num_cells
+    snake_body = array('i', data[position:position + 4 * body_length])
+    position += 4 * body_length
+    free_cells = array('i', data[position:position + 4 * free_length])
+    position += 4 * free_length
+    rng_state = (3, RNG_STATE.unpack_from(data, position), gauss_next if has_gauss else None)
+    free_index = array('i', [-1]) * num_cells
+    for index, cell_id in enumerate(free_cells):
+        free_index[cell_id] = index
+    return (board, snake_body, food, DIRECTIONS[direction], bool(grow_check), points, bool(wrap_mode),
+            free_cells, free_index, rng_state)
+
+class Recorder:
+    """
+    Plays a game and records it. Change direction and wrap mode on recorder.model as usual,
+    then call recorder.next_step instead of model.next_step.
+    """
+    def __init__(self, num_cols, num_rows, seed=None, wrap_mode=False, checkpoint_interval=1000):
+        """ Start a new game, a seed is picked when none is given since the replay needs one """
+        if seed is None:
+            seed = random.randrange(2 ** 63)
+        self.seed = seed
+        self.wrap_mode = wrap_mode
+        self.checkpoint_interval = checkpoint_interval
+        self.model = SnakeModel(num_cols, num_rows, seed, wrap_mode)
+        self.steps = 0
+        self.inputs = []        # (step, input)
+        self.checkpoints = []   # (step, encoded state)
+        self.last_direction = self.model.next_direction
+        self.last_wrap_mode = wrap_mode
+
+    def next_step(self):
+        """ Record the inputs since the last step, then step the model. Returns the StepOutcome """
+        model = self.model
+        if self.steps % self.checkpoint_interval == 0:
+            self.checkpoints.append((self.steps, encode_state(model.snapshot())))
+        if model.next_direction != self.last_direction:
+            self.inputs.append((self.steps, DIRECTIONS.index(model.next_direction)))
+            self.last_direction = model.next_direction
+        if model.WRAP_MODE != self.last_wrap_mode:
+            self.inputs.append((self.steps, WRAP_ON if model.WRAP_MODE else WRAP_OFF))
+            self.last_wrap_mode = model.WRAP_MODE
+        self.steps += 1
+        return model.next_step()
+
+    def to_bytes(self):
+        """ The replay file contents """
+        flags = 1 if self.wrap_mode else 0
+        out = bytearray(HEADER.pack(MAGIC, VERSION, flags, self.model.num_rows, self.model.num_cols,
+                                    self.seed, self.checkpoint_interval, self.steps))
+        write_varint(out, len(self.inputs))
+        previous = 0
+        for step, code in self.inputs:
+            write_varint(out, (step - previous) << 3 | code)
+            previous = step
+        write_varint(out, len(self.checkpoints))
+        for step, data in self.checkpoints:
+            write_varint(out, step)
+            write_varint(out, len(data))
+            out += data
+        return bytes(out)
+
+    def save(self, path):
+        """ Write the replay file """
+        with open(path, "wb") as replay_file:
+            replay_file.write(self.to_bytes())
+
+class Replay:
+    """ A recorded game that can be played back and seeked headless """
+    def __init__(self, data):
+        """ Read the contents of a replay file """
+        (magic, version, flags, self.num_rows, self.num_cols, self.seed, self.checkpoint_interval,
+         self.steps) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a snake replay")
+        self.wrap_mode = bool(flags & 1)
+        position = HEADER.size
+        count, position = read_varint(data, position)
+        self.input_steps = []
+        self.input_codes = []
+        step = 0
+        for index in range(count):
+            value, position = read_varint(data, position)
+            step += value >> 3
+            self.input_steps.append(step)
+            self.input_codes.append(value & 7)
+        count, position = read_varint(data, position)
+        self.checkpoint_steps = []
+        self.checkpoint_data = []
+        for index in range(count):
+            step, position = read_varint(data, position)
+            size, position = read_varint(data, position)
+            self.checkpoint_steps.append(step)
+            self.checkpoint_data.append(data[position:position + size])
+            position += size
+
+    @classmethod
+    def load(cls, path):
+        """ Read a replay file """
+        with open(path, "rb") as replay_file:
+            return cls(replay_file.read())
+
+    def seek(self, step):
+        """
+        Return a SnakeModel in the state it had after step steps. Starts from the last checkpoint
+        before step, so it costs at most checkpoint_interval steps.
+        """
+        step = min(step, self.steps)
+        model = SnakeModel(self.num_cols, self.num_rows, self.seed, self.wrap_mode)
+        checkpoint = bisect_right(self.checkpoint_steps, step) - 1
+        current = 0
+        if checkpoint >= 0:
+            current = self.checkpoint_steps[checkpoint]
+            model.restore(decode_state(self.checkpoint_data[checkpoint], self.num_rows * self.num_cols))
+        self.play_steps(model, current, step)
+        return model
+
+    def play(self):
+        """ Play the whole game, returns the model at the end """
+        return self.seek(self.steps)
+
+    def play_steps(self, model, current, stop, on_step = None):
+        """ 
+        Step model from step current up to step stop, applying the recorded inputs. on_step is called with 
+        the model and the step number after every step, for streaming the game as it is played back 
+        """
+        index = bisect_left(self.input_steps, current)
+        input_steps = self.input_steps
+        next_input = input_steps[index] if index < len(input_steps) else -1
+        next_step = model.next_step
+        while current < stop:
+            while next_input == current:
+                code = self.input_codes[index]
+                if code < 4:
+                    model.next_direction = DIRECTIONS[code]
+                else:
+                    model.WRAP_MODE = code == WRAP_ON
+                index += 1
+                next_input = input_steps[index] if index < len(input_steps) else -1
+            if next_step() >= StepOutcome.DIED_WALL:
+                return
+            current += 1
+            if on_step is not None:
+                on_step(model, current)
+
+def record_game(path, seed=None, num_rows=30, num_cols=30, wrap_mode=False, policy=None, max_steps=100000,
+                checkpoint_interval=1000):
+    """ Play one game with policy like snake7.run_headless and save its replay to path, returns the Recorder """
+    recorder = Recorder(num_cols, num_rows, seed, wrap_mode, checkpoint_interval)
+    model = recorder.model
+    while recorder.steps < max_steps:
+        if policy is not None:
+            direction = policy(model)
+            if direction is not None:
+                model.change_direction(direction)
+        if recorder.next_step() >= StepOutcome.DIED_WALL:
+            break
+    recorder.save(path)
+    return recorder
+
+def main():
+    """ Print what is in a replay file and how long it takes to play it back """
+    parser = argparse.ArgumentParser(description = "Play back a snake replay headless")
+    parser.add_argument("replay")
+    parser.add_argument("--seek", type = int, default = None, help = "step to seek to instead of the end")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    replay = Replay.load(args.replay)
+    model = replay.play() if args.seek is None else replay.seek(args.seek)
+    seconds = time.perf_counter() - start
+    print("{}x{} board, seed {}, {} steps, {} inputs, {} checkpoints".format(
+        replay.num_rows, replay.num_cols, replay.seed, replay.steps, len(replay.input_steps),
+        len(replay.checkpoint_steps)))
+    print("{} points, length {} after {:.1f} ms".format(model.current_points, len(model.snake_body),
+                                                         seconds * 1000))
+
+class ReplayTest(unittest.TestCase):
+    """
+    For checking that replays play back exactly the recorded game.
+    """
+    def policy(self, model):
+        """ Turn now and then, so there are inputs to record. Never draws from model.rng, that would change the game """
+        if self.rng.random() < 0.2:
+            return "NESW"[self.rng.randrange(4)]
+        return None
+
+    def test_playbackAndSeek(self):
+        self.rng = random.Random(3)
+        recorder = Recorder(12, 10, 3, True, checkpoint_interval = 50)
+        states = [recorder.model.snapshot()]
+        for step in range(400):
+            direction = self.policy(recorder.model)
+            if direction is not None:
+                recorder.model.change_direction(direction)
+            if step == 300:
+                recorder.model.WRAP_MODE = False
+            if recorder.next_step() >= StepOutcome.DIED_WALL:
+                break
+            states.append(recorder.model.snapshot())
+        replay = Replay(recorder.to_bytes())
+        self.assertEqual(replay.steps, recorder.steps)
+        self.assertEqual(replay.play().board, recorder.model.board)
+        for step in [step for step in (0, 1, 49, 50, 51, 137, 299, 301) if step < len(states)] + [len(states) - 1]:
+            model = replay.seek(step)
+            self.assertEqual(bytes(model.board), states[step][0])
+            self.assertEqual(model.current_points, states[step][5])
+
+if __name__ == "__main__":
+    main()
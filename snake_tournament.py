@@ -0,0 +1,121 @@
+"""
+
+Plays tens of thousands of seeded snake games against an automated policy on every core.
+
+Seeds are split into chunks and handed to a process pool. Each worker plays its games with
+snake7.run_headless and sends back one small tuple per game, never a board, so the parent can
+stream results as chunks finish. Game n always uses seed base_seed + n, so results do not depend
+on the number of workers or the chunk size.
+
+"""
+import argparse
+import csv
+import importlib
+import multiprocessing
+import os
+import sys
+import time
+import unittest
+from collections import namedtuple
+
+from snake7 import run_headless
+
+GameResult = namedtuple("GameResult", "seed points length steps cause seconds")
+
+def load_policy(name):
+    """ Turn "module:function" into the policy function, None stays None (keep going straight) """
+    if name is None:
+        return None
+    module, function = name.split(":")
+    return getattr(importlib.import_module(module), function)
+
+def play_chunk(job):
+    """ Worker: play the games of one chunk of seeds and return their results """
+    seeds, num_rows, num_cols, wrap_mode, policy_name, max_steps = job
+    policy = load_policy(policy_name)
+    results = []
+    for seed in seeds:
+        result = run_headless(seed, num_rows, num_cols, wrap_mode, policy, max_steps)
+        results.append(GameResult(seed, result["points"], result["length"], result["steps"],
+                                  result["cause"] or "max_steps", result["seconds"]))
+    return results
+
+def run_tournament(num_games, num_rows = 30, num_cols = 30, wrap_mode = False, policy = None,
+                   max_steps = 100000, base_seed = 0, workers = None, chunk_size = 64):
+    """
+    Play num_games games with seeds base_seed .. base_seed + num_games - 1 on workers processes
+    (all cores by default). policy is a "module:function" name so workers can import it.
+    Yields a GameResult per game as soon as its chunk is done, in no particular order.
+    """
+    policy_name = policy
+    load_policy(policy_name)    # Fail here, not in every worker, when the policy does not exist
+    jobs = [(range(start, min(start + chunk_size, base_seed + num_games)), num_rows, num_cols,
+             wrap_mode, policy_name, max_steps)
+            for start in range(base_seed, base_seed + num_games, chunk_size)]
+    if workers == 1:
+        for job in jobs:
+            yield from play_chunk(job)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for results in pool.imap_unordered(play_chunk, jobs):
+            yield from results
+
+def scaling_benchmark(num_games, workers_list, **options):
+    """ Play the same games with every worker count and return (workers, games per second, speedup) rows """
+    rows = []
+    for workers in workers_list:
+        start = time.perf_counter()
+        for result in run_tournament(num_games, workers = workers, **options):
+            pass
+        rate = num_games / (time.perf_counter() - start)
+        rows.append((workers, rate, rate / rows[0][1] if rows else 1.0))
+    return rows
+
+def main():
+    """ Run a tournament and write one CSV line per game, or with --scaling time it for 1, 2, 4 ... workers """
+    parser = argparse.ArgumentParser(description = "Play many seeded snake games on every core")
+    parser.add_argument("--games", type = int, default = 10000)
+    parser.add_argument("--rows", type = int, default = 30)
+    parser.add_argument("--cols", type = int, default = 30)
+    parser.add_argument("--wrap", action = "store_true")
+    parser.add_argument("--policy", default = None, help = "policy as module:function, default keeps going straight")
+    parser.add_argument("--steps", type = int, default = 100000, help = "maximum steps per game")
+    parser.add_argument("--seed", type = int, default = 0, help = "seed of the first game")
+    parser.add_argument("--workers", type = int, default = None, help = "processes, default all cores")
+    parser.add_argument("--chunk-size", type = int, default = 64, help = "games per task sent to a worker")
+    parser.add_argument("--output", default = None, help = "CSV file, default standard output")
+    parser.add_argument("--scaling", action = "store_true", help = "print how games/sec grows with workers")
+    args = parser.parse_args()
+    options = dict(num_rows = args.rows, num_cols = args.cols, wrap_mode = args.wrap, policy = args.policy,
+                   max_steps = args.steps, base_seed = args.seed, chunk_size = args.chunk_size)
+    if args.scaling:
+        cores = args.workers or os.cpu_count()
+        workers_list = [1]
+        while workers_list[-1] * 2 <= cores:
+            workers_list.append(workers_list[-1] * 2)
+        if workers_list[-1] != cores:
+            workers_list.append(cores)
+        for workers, rate, speedup in scaling_benchmark(args.games, workers_list, **options):
+            print("{:3d} workers: {:10.1f} games/sec  speedup {:.2f}".format(workers, rate, speedup))
+        return
+    output = open(args.output, "w", newline = "") if args.output else sys.stdout
+    writer = csv.writer(output)
+    writer.writerow(GameResult._fields)
+    for result in run_tournament(args.games, workers = args.workers, **options):
+        writer.writerow(result)
+    if args.output:
+        output.close()
+
+class TournamentTest(unittest.TestCase):
+    """
+    For checking that results do not depend on how games are shared between workers.
+    """
+    def test_sameResultsWithAnyWorkers(self):
+        key = lambda result: result[:5]
+        alone = sorted(map(key, run_tournament(40, 12, 12, workers = 1, chunk_size = 40)))
+        shared = sorted(map(key, run_tournament(40, 12, 12, workers = 2, chunk_size = 3)))
+        self.assertEqual(alone, shared)
+        self.assertEqual([result[0] for result in alone], list(range(40)))
+
+if __name__ == "__main__":
+    main()